@@ -0,0 +1,81 @@
+import threading
+import requests
+from collections import defaultdict
+from time import time
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from state_view import loads
+
+class APIError(Exception):
+    pass
+
+class PanelClient(object):
+    def __init__(self, url, pool_size=4, retries=3, backoff=0.1, connect_timeout=3.0, read_timeout=30.0):
+        if url.endswith('/'):
+            url = url[:-1]
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # Only idempotent requests are retried after they reach the server, POSTs only on connection errors
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.latencies = defaultdict(float)
+        self.max_latencies = defaultdict(float)
+        self.last_decode = 0.0
+
+    def request(self, endpoint, method, path, raw=False, decode=loads, **kwargs):
+        start = time()
+        try:
+            response = self.session.request(method, self.url + path, timeout=self.timeout, **kwargs)
+            decode_start = time()
+            payload = response.content if raw else decode(response.content)
+            self.last_decode = time() - decode_start
+        except (requests.RequestException, ValueError) as e:
+            with self.lock:
+                self.errors[endpoint] += 1
+            raise APIError('{} {} failed: {}'.format(method, path, e))
+        finally:
+            elapsed = time() - start
+            with self.lock:
+                self.counts[endpoint] += 1
+                self.latencies[endpoint] += elapsed
+                self.max_latencies[endpoint] = max(self.max_latencies[endpoint], elapsed)
+        return payload
+
+    def list_games(self, mode, status='open'):
+        return self.request('list', 'GET', '/game/list', params={'status': status, 'mode': mode})
+
+    def join(self, payload):
+        return self.request('join', 'POST', '/game/join', json=payload)
+
+    def create(self, payload):
+        return self.request('create', 'POST', '/game/create/', json=payload)
+
+    def poll(self, uuid, decode=loads):
+        return self.request('poll', 'GET', '/play/{}'.format(uuid), params={'poll': 1}, decode=decode)
+
+    def play(self, uuid, event):
+        return self.request('play', 'POST', '/play/{}'.format(uuid), json=event)
+
+    def leave(self, uuid):
+        return self.request('leave', 'DELETE', '/play/{}'.format(uuid), raw=True)
+
+    def stats(self):
+        with self.lock:
+            result = {}
+            for endpoint, count in self.counts.items():
+                result[endpoint] = {
+                    'count': count,
+                    'errors': self.errors[endpoint],
+                    'mean': self.latencies[endpoint] / count,
+                    'max': self.max_latencies[endpoint],
+                }
+            return result
+
+    def close(self):
+        self.session.close()
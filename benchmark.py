@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+import argparse
+import gc
+import json
+import sys
+from time import time
+from json_api import FrameRequest, FrameResponse, FrameInterpolator, make_test_states
+from replay import ReplayReader
+from state_view import GameState
+
+SCENARIOS = (
+    ("early", 2),
+    ("mid", 14),
+    ("full", 28),
+)
+
+def synthetic_scenarios(seed=3):
+    states = make_test_states(turns=SCENARIOS[-1][1] + 1, seed=seed)
+    return [(name, states[turn - 1], states[turn]) for name, turn in SCENARIOS]
+
+def move_blocks(state):
+    child = state["childStates"][state["player"]]
+    for event in reversed(child.get("events", ())):
+        if "blocks" in event:
+            return event["blocks"]
+    return None
+
+def recorded_scenarios(path):
+    reader = ReplayReader(path)
+    pairs = []
+    # Games played concurrently are interleaved in the log so the pairs are taken within every game
+    for game in range(len(reader.uuids)):
+        states = [state for state in reader.states(game) if state.get("canPlay")]
+        pairs.extend((previous, target) for previous, target in zip(states, states[1:]) if move_blocks(target) is not None)
+    reader.close()
+    if not pairs:
+        raise ValueError("{} does not contain enough recorded states".format(path))
+    indexes = [int(fraction * (len(pairs) - 1)) for fraction in (0.05, 0.5, 0.95)]
+    return [(name,) + pairs[index] for (name, _), index in zip(SCENARIOS, indexes)]
+
+def measure(setup, func, number, repeat=3):
+    best = None
+    for _ in range(repeat):
+        args = [setup() for _ in range(number)]
+        # With the collector off the generation 0 counter is the net number of gc tracked containers
+        # created, strings, numbers and freed temporaries are not counted
+        gc.collect()
+        gc.disable()
+        try:
+            objects = gc.get_count()[0]
+            start = time()
+            for arg in args:
+                func(arg)
+            elapsed = time() - start
+            objects = gc.get_count()[0] - objects
+        finally:
+            gc.enable()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, objects)
+    elapsed, objects = best
+    return {
+        "ops_per_sec": number / elapsed if elapsed else float("inf"),
+        "gc_objects_per_op": float(objects) / number,
+    }
+
+def gc_objects(result):
+    # Results saved before the rename call it allocs_per_op
+    return result.get("gc_objects_per_op", result.get("allocs_per_op", 0.0))
+
+def benchmarks(previous, target):
+    frame = FrameRequest.from_json(target)
+    wire = frame.to_string()
+    payload = json.dumps(target, separators=(",", ":"))
+    deal = previous["deals"][previous["childStates"][previous["player"]]["dealIndex"]]
+    blocks = move_blocks(target)
+    if blocks is None:
+        # Decoded like a missing move in the interpolator
+        blocks = list(deal) + [0] * (2 * target.get("width", 6) - 2)
+
+    def primed():
+        interpolator = FrameInterpolator()
+        for _ in interpolator.step(previous):
+            pass
+        return interpolator, target
+
+    return [
+        ("FrameRequest.from_string", lambda: wire, FrameRequest.from_string),
+        ("FrameRequest.to_string", lambda: FrameRequest.from_string(wire), FrameRequest.to_string),
+        ("GameState.from_payload", lambda: payload, GameState.from_payload),
+        ("FrameRequest.from_json", lambda: target, FrameRequest.from_json),
+        ("FrameResponse.from_blocks", lambda: blocks, lambda b: FrameResponse.from_blocks(b, deal)),
+        ("FrameInterpolator.step", primed, lambda args: list(args[0].step(args[1]))),
+    ]
+
+def run(scenarios, number):
+    results = {}
+    for scenario, previous, target in scenarios:
+        for name, setup, func in benchmarks(previous, target):
+            results["{}[{}]".format(name, scenario)] = measure(setup, func, number)
+    return results
+
+def compare(baseline, current, threshold):
+    regressions = []
+    for name in sorted(baseline):
+        if name not in current:
+            continue
+        before = baseline[name]
+        after = current[name]
+        speed = after["ops_per_sec"] / before["ops_per_sec"]
+        # Only speed counts, the gc object count is too coarse to flag on its own
+        flags = []
+        if speed < 1 - threshold:
+            flags.append("slower")
+        print ("{:45} {:10.0f} -> {:10.0f} ops/s ({:+6.1%})  {:7.1f} -> {:7.1f} gc objects/op  {}".format(
+            name, before["ops_per_sec"], after["ops_per_sec"], speed - 1,
+            gc_objects(before), gc_objects(after), ", ".join(flags)))
+        if flags:
+            regressions.append(name)
+    return regressions
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the frame codec and interpolator')
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks and save the results as JSON')
+    run_parser.add_argument('--output', type=str, help='File to save the results to')
+    run_parser.add_argument('--number', type=int, default=2000, help='Iterations per benchmark')
+    run_parser.add_argument('--replay', type=str, help='Take the early, mid and full positions from a replay log instead of generated games')
+    run_parser.add_argument('--baseline', type=str, help='Compare against this saved result')
+    run_parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown counted as a regression')
+    compare_parser = subparsers.add_parser('compare', help='Compare two saved results')
+    compare_parser.add_argument('baseline', type=str)
+    compare_parser.add_argument('current', type=str)
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown counted as a regression')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        scenarios = recorded_scenarios(args.replay) if args.replay else synthetic_scenarios()
+        results = run(scenarios, args.number)
+        for name in sorted(results):
+            print ("{:45} {:10.0f} ops/s  {:7.1f} gc objects/op".format(name, results[name]["ops_per_sec"], results[name]["gc_objects_per_op"]))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if args.baseline:
+            sys.exit(1 if compare(load(args.baseline), results, args.threshold) else 0)
+    else:
+        sys.exit(1 if compare(load(args.baseline), load(args.current), args.threshold) else 0)
@@ -0,0 +1,90 @@
+import threading
+import traceback
+from collections import defaultdict
+from json_api import DRAW, FrameDriver
+from bridgelog import log
+
+class BotPool(object):
+    def __init__(self, size=1, factory=FrameDriver):
+        self.size = size
+        self.factory = factory
+        self.idle = defaultdict(list)
+        self.lock = threading.Lock()
+        self.spawned = 0
+        self.reused = 0
+        self.recycled = 0
+
+    def spawn(self, executable):
+        with self.lock:
+            self.spawned += 1
+        return self.factory(executable)
+
+    def warm(self, executable):
+        while True:
+            with self.lock:
+                if len(self.idle[executable]) >= self.size:
+                    return
+            driver = self.spawn(executable)
+            with self.lock:
+                # Another thread may have filled the pool while this bot booted
+                if len(self.idle[executable]) < self.size:
+                    self.idle[executable].append(driver)
+                    continue
+            driver.kill()
+            return
+
+    def rewarm(self, executable):
+        try:
+            self.warm(executable)
+        except Exception:
+            log.warning('bot_warm_failed', executable=executable, traceback=traceback.format_exc())
+
+    def acquire(self, executable):
+        driver = None
+        with self.lock:
+            while self.idle[executable] and driver is None:
+                driver = self.idle[executable].pop()
+                if not driver.alive():
+                    self.recycled += 1
+                    driver = None
+            if driver is not None:
+                self.reused += 1
+        if driver is None:
+            driver = self.spawn(executable)
+        return driver
+
+    def release(self, executable, driver, game_result=DRAW):
+        try:
+            driver.reset(game_result)
+            healthy = driver.alive()
+        except Exception:
+            log.warning('bot_reset_failed', executable=executable, traceback=traceback.format_exc())
+            healthy = False
+        with self.lock:
+            if healthy and len(self.idle[executable]) < self.size:
+                self.idle[executable].append(driver)
+                return
+            if not healthy:
+                self.recycled += 1
+        driver.kill()
+        if not healthy:
+            # Boot the replacement in the background so that it is ready by the time the next game begins
+            thread = threading.Thread(target=self.rewarm, args=(executable,), name='warm-{}'.format(executable))
+            thread.daemon = True
+            thread.start()
+
+    def close(self):
+        with self.lock:
+            drivers = [driver for idle in self.idle.values() for driver in idle]
+            self.idle.clear()
+        for driver in drivers:
+            driver.kill()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'spawned': self.spawned,
+                'reused': self.reused,
+                'recycled': self.recycled,
+                'idle': sum(len(idle) for idle in self.idle.values()),
+            }
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+import argparse
+import io
+import os
+import socket
+import subprocess
+import threading
+import Queue
+import bridgelog
+from bridgelog import log
+from transport import BUFFER_SIZE, parse_address
+
+def pump_to_bot(connection, process):
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    fd = process.stdin.fileno()
+    try:
+        while True:
+            count = connection.recv_into(buffer)
+            if not count:
+                break
+            data = view[:count]
+            while data:
+                data = data[os.write(fd, data):]
+    except (IOError, OSError):
+        pass
+    finally:
+        process.stdin.close()
+        # The client is gone, a bot that does not exit on EOF would keep the other pump blocked forever
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+def pump_from_bot(process, connection):
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    output = io.FileIO(process.stdout.fileno(), "r", closefd=False)
+    try:
+        while True:
+            count = output.readinto(buffer)
+            if not count:
+                break
+            connection.sendall(view[:count])
+    except (IOError, OSError):
+        pass
+
+class BotDaemon(object):
+    def __init__(self, executable, warm=1, cpus=None):
+        self.command = [executable]
+        if cpus:
+            # Python 2 cannot set the CPU affinity itself
+            self.command = ["taskset", "-c", cpus] + self.command
+        self.warm = warm
+        self.idle = Queue.Queue()
+        self.connections = 0
+        for _ in range(warm):
+            self.idle.put(self.launch())
+
+    def launch(self):
+        return subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def replenish(self):
+        self.idle.put(self.launch())
+
+    def take(self):
+        process = None
+        while process is None:
+            try:
+                process = self.idle.get_nowait()
+            except Queue.Empty:
+                process = self.launch()
+                break
+            if process.poll() is not None:
+                process = None
+        if self.warm:
+            # Boot the next bot now so that the next connection does not wait for it
+            thread = threading.Thread(target=self.replenish)
+            thread.daemon = True
+            thread.start()
+        return process
+
+    def serve(self, connection, address):
+        self.connections += 1
+        process = self.take()
+        log.info("bot_connected", peer=address, pid=process.pid)
+        upstream = threading.Thread(target=pump_to_bot, args=(connection, process))
+        upstream.daemon = True
+        upstream.start()
+        try:
+            pump_from_bot(process, connection)
+        finally:
+            try:
+                process.kill()
+            except OSError:
+                pass
+            process.wait()
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            connection.close()
+            upstream.join()
+            log.info("bot_disconnected", peer=address, pid=process.pid, returncode=process.returncode)
+
+    def listen(self, endpoint):
+        family, address = parse_address(endpoint)
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.unlink(address)
+        else:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        server.listen(64)
+        return server
+
+    def run(self, endpoint):
+        server = self.listen(endpoint)
+        log.info("listening", endpoint=endpoint, command=" ".join(self.command))
+        while True:
+            connection, address = server.accept()
+            if server.family == socket.AF_INET:
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self.serve, args=(connection, address))
+            thread.daemon = True
+            thread.start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a puyoai bot on a unix socket or TCP port, one bot process per connection')
+    parser.add_argument('command', metavar='command', type=str, help='Executable for the puyoai bot')
+    parser.add_argument('endpoint', metavar='endpoint', type=str, help='unix:PATH or tcp:[HOST]:PORT to listen on')
+    parser.add_argument('--warm', type=int, default=1, help='Number of bot processes to keep booted for new connections')
+    parser.add_argument('--cpus', type=str, help='CPU list to pin the bots to, as taken by taskset -c')
+    parser.add_argument('--log-level', choices=sorted(bridgelog.LEVELS), default='info')
+
+    args = parser.parse_args()
+    bridgelog.configure(args.log_level)
+    try:
+        BotDaemon(args.command, args.warm, args.cpus).run(args.endpoint)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,133 @@
+import atexit
+import sys
+import threading
+from collections import deque
+from time import time, strftime, localtime
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {
+    "debug": DEBUG,
+    "info": INFO,
+    "warning": WARNING,
+    "error": ERROR,
+}
+LEVEL_NAMES = dict((level, name.upper()) for name, level in LEVELS.items())
+
+class Record(object):
+    __slots__ = ("time", "level", "thread", "event", "fields")
+
+    def __init__(self, level, event, fields):
+        self.time = time()
+        self.level = level
+        self.thread = threading.current_thread().name
+        self.event = event
+        self.fields = fields
+
+class StreamSink(object):
+    def __init__(self, stream=sys.stdout, level=DEBUG, boards=False):
+        self.stream = stream
+        self.level = level
+        self.boards = boards
+
+    def format_value(self, value):
+        if hasattr(value, "render"):
+            # Frames stay objects until here so that they are only rendered when someone reads them
+            if self.boards:
+                return "\n" + value.render()
+            return value.to_string()
+        return str(value)
+
+    def write(self, record):
+        if record.level < self.level:
+            return
+        parts = [
+            strftime("%H:%M:%S", localtime(record.time)),
+            LEVEL_NAMES.get(record.level, str(record.level)),
+            record.thread,
+            record.event,
+        ]
+        for key, value in sorted(record.fields.items()):
+            parts.append("{}={}".format(key, self.format_value(value)))
+        self.stream.write(" ".join(parts) + "\n")
+
+    def flush(self):
+        self.stream.flush()
+
+class Logger(object):
+    def __init__(self, level=INFO, capacity=4096):
+        self.level = level
+        self.records = deque(maxlen=capacity)
+        self.sinks = []
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.writer = None
+
+    def enabled(self, level):
+        return level >= self.level and bool(self.sinks)
+
+    def log(self, level, event, **fields):
+        if level < self.level or not self.sinks:
+            return
+        record = Record(level, event, fields)
+        with self.condition:
+            if len(self.records) == self.records.maxlen:
+                self.dropped += 1
+            self.records.append(record)
+            self.condition.notify()
+
+    def debug(self, event, **fields):
+        self.log(DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(ERROR, event, **fields)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        self.start()
+
+    def start(self):
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.run, name="log-writer")
+            self.writer.daemon = True
+            self.writer.start()
+
+    def take(self):
+        with self.condition:
+            records = list(self.records)
+            self.records.clear()
+        return records
+
+    def write(self, records):
+        for sink in self.sinks:
+            for record in records:
+                sink.write(record)
+            sink.flush()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.records:
+                    self.condition.wait(1)
+            self.flush()
+
+    def flush(self):
+        with self.write_lock:
+            self.write(self.take())
+
+log = Logger()
+atexit.register(log.flush)
+
+def configure(level="info", boards=False, stream=sys.stdout):
+    log.level = LEVELS[level]
+    log.add_sink(StreamSink(stream, log.level, boards))
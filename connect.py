@@ -1,77 +1,235 @@
 import os.path
-import requests
 import argparse
+from time import time
 from json_api import *
+from api import PanelClient
+from bot_pool import BotPool
+from dashboard import Feed
+from decision_cache import DecisionCache, DEFAULT_CAPACITY
+import bridgelog
+from bridgelog import log
+from legality import nearest_legal, fallback_move, placement
+import metrics
+from metrics import metrics as stats
+from poller import Poller
+import profiling
+from replay import ReplayWriter, GameRecorder
+from state_view import GameState
 
-def main(command, url, autojoin=False):
-    name = os.path.basename(command)
-    mode = 'puyo:duel'
-    if url.endswith('/'):
-        url = url[:-1]
-    restart = False
+MODE = 'puyo:duel'
+PHASE_SECONDS = 'bridge_phase_seconds'
+MOVE_SECONDS = 'bridge_move_seconds'
+# Results of the panel from our side as puyoai game results
+GAME_RESULTS = {'win': P1_WIN, 'loss': P2_WIN, 'draw': DRAW}
+# Part of the server's turn limit the bot may use, the rest is left for posting the move
+TIME_LIMIT_SHARE = 0.8
+
+def open_game(client, name, autojoin=False):
+    games = client.list_games(MODE)['games']
+    payload = {
+        'metadata': {'name': 'puyoai-{}'.format(name)},
+    }
+    if games and autojoin:
+        payload['id'] = games[0]['id']
+        response = client.join(payload)
+    else:
+        payload['mode'] = MODE
+        response = client.create(payload)
+    log.info('game_opened', response=response)
+    return response['id']
+
+def decision_budget(state, decision_timeout=None):
+    budgets = [decision_timeout]
+    if state.time_limit:
+        budgets.append(state.time_limit * TIME_LIMIT_SHARE)
+    budgets = [budget for budget in budgets if budget is not None]
+    return min(budgets) if budgets else None
+
+def decode_state(body):
+    # The body is handed on next to the state for the replay log instead of being kept in it
+    return GameState.from_payload(body), body
+
+def play_game(driver, client, uuid, recorder=None, bot='bot', decision_timeout=None):
+    poller = Poller(lambda: client.poll(uuid, decode_state), lambda polled: polled[0].key())
+    polled = decoded = 0.0
     while True:
-        if restart:
-            sleep(1)
-        response = requests.get('{}/game/list?status=open&mode={}'.format(url, mode))
-        payload = {
-            'metadata': {'name': 'puyoai-{}'.format(name)},
-        }
-        if (response.json()['games']) and autojoin:
-            payload['id'] = response.json()['games'][0]['id']
-            response = requests.post('{}/game/join'.format(url), json=payload)
-        else:
-            payload['mode'] = mode
-            response = requests.post('{}/game/create/'.format(url), json=payload)
-        print (response.content)
-        uuid = response.json()['id']
-        restart = False
-        try:
-            driver = FrameDriver(command)
-            while not restart:
-                sleep(0.2)
-                response = requests.get('{}/play/{}?poll=1'.format(url, uuid))
-                state = response.json()
-                status = state.get('status', {})
-                if status.get('terminated'):
-                    print (status.get('result'), 'restarting...')
-                    restart = True
-                    break
-                if state.get('canPlay'):
-                    deal = state["deals"][state["childStates"][state["player"]]["dealIndex"]]
-                    print ('playing piece', deal)
-                    blocks = driver.play(state)
+        start = time()
+        state, body = poller.poll()
+        polled += time() - start
+        decoded += client.last_decode
+        if recorder and (state.can_play or state.terminated):
+            recorder.state(state, body)
+        if state.terminated:
+            log.info('game_over', game=uuid, result=state.result)
+            log.info('poll_stats', game=uuid, **poller.stats())
+            log.info('predictions', game=uuid, hits=driver.prediction_hits, total=driver.predictions)
+            if driver.cache is not None:
+                log.info('decision_cache', game=uuid, **driver.cache.stats())
+            return GAME_RESULTS.get(state.result, DRAW)
+        if state.can_play:
+            deal = list(state.deal(state.own.deal_index))
+            log.info('playing_piece', game=uuid, deal=deal)
+            # Everything since the previous move was spent waiting for the server to reach this state
+            stats.observe(PHASE_SECONDS, polled - decoded, bot=bot, phase='poll')
+            stats.observe(PHASE_SECONDS, decoded, bot=bot, phase='decode')
+            start = time()
+            width = state.width
+            try:
+                move = driver.decide(state, decision_budget(state, decision_timeout))
+                stats.observe(PHASE_SECONDS, driver.interpolate_time, bot=bot, phase='interpolate')
+                stats.observe(PHASE_SECONDS, driver.think_time, bot=bot, phase='think')
+            except (BotTimeout, BotProtocolError, EOFError, IOError) as e:
+                # Answer right away with a cheap placement while a fresh bot boots
+                log.warning('bot_fallback', game=uuid, error=e)
+                stats.inc('bridge_fallback_moves_total', bot=bot)
+                driver.restart()
+                move = fallback_move(state.own.blocks, width) or FrameResponse()
+            except ValueError as e:
+                # The state could not be turned into frames, the bot is fine and picks the game up from the next state
+                log.warning('state_fallback', game=uuid, error=e)
+                stats.inc('bridge_fallback_moves_total', bot=bot)
+                driver.resync()
+                move = fallback_move(state.own.blocks, width) or FrameResponse()
+            legal_move = nearest_legal(state.own.blocks, move, width)
+            if legal_move is None or (legal_move.x, legal_move.r) != placement(move, width):
+                log.warning('unreachable_move', game=uuid, x=move.x, r=move.r)
+                stats.inc('bridge_unreachable_moves_total', bot=bot)
+            posted = legal_move or move
+            blocks = posted.to_blocks(deal, width)
+            event = {
+                'type': 'addPuyos',
+                'blocks': blocks,
+            }
+            posted_at = time()
+            response = client.play(uuid, event)
+            if not response['success']:
+                posted = None
+                stats.inc('bridge_rejected_moves_total', bot=bot)
+                log.warning('bad_blocks', game=uuid, blocks=blocks)
+                # The server disagrees with the local rules so fall back to trying every column
+                for i in range(width - 1):
+                    suicide = ([0] * i) + deal + ([0] * (width - i - 2))
+                    log.warning('suicide_attempt', game=uuid, blocks=suicide)
+                    stats.inc('bridge_illegal_move_retries_total', bot=bot)
                     event = {
                         'type': 'addPuyos',
-                        'blocks': blocks,
+                        'blocks': suicide,
                     }
-                    response = requests.post('{}/play/{}'.format(url, uuid), json=event)
-                    if not response.json()['success']:
-                        print ('bad blocks', blocks)
-                        # The bots pick badly sometimes so we need to suicide like this
-                        for i in range(WIDTH - 1):
-                            suicide = ([0] * i) + deal + ([0] * (WIDTH - i - 2))
-                            print ('suicide attempt', suicide)
-                            event = {
-                                'type': 'addPuyos',
-                                'blocks': suicide,
-                            }
-                            response = requests.post('{}/play/{}'.format(url, uuid), json=event)
-                            if response.json()['success']:
-                                break
-                    if not response.json()['success']:
-                        reason = response.json().get('reason', '')
-                        raise ValueError('Cannot play a move because %s' % reason)
+                    response = client.play(uuid, event)
+                    if response['success']:
+                        break
+            if not response['success']:
+                reason = response.get('reason', '')
+                raise ValueError('Cannot play a move because %s' % reason)
+            stats.observe(PHASE_SECONDS, time() - posted_at, bot=bot, phase='post')
+            stats.observe(MOVE_SECONDS, time() - start + polled, bot=bot)
+            polled = decoded = 0.0
+            if posted is not None:
+                try:
+                    driver.pre_decide(posted)
+                except (EOFError, IOError) as e:
+                    # Boot a fresh bot now rather than when the next decision is due
+                    log.warning('bot_pre_decision_failed', game=uuid, error=e)
+                    driver.restart()
+            poller.reset()
+
+def run_game(command, client, options, pool=None, replay=None, cache=None, feed=None):
+    bot = os.path.basename(command)
+    uuid = open_game(client, bot, options.autojoin)
+    profiling.set_game(uuid)
+    recorder = None
+    try:
+        driver = pool.acquire(command) if pool else make_driver(command, options, cache)
+        if replay:
+            recorder = GameRecorder(replay, uuid)
+            driver.listeners.append(recorder)
+        publisher = None
+        if feed:
+            publisher = feed.publisher(uuid, bot)
+            driver.listeners.append(publisher)
+        try:
+            game_result = play_game(driver, client, uuid, recorder, bot, options.decision_timeout)
+        except Exception:
+            driver.kill()
+            stats.inc('bridge_game_errors_total', bot=bot)
+            raise
+        stats.inc('bridge_games_total', bot=bot)
+        if publisher:
+            driver.listeners.remove(publisher)
+        if pool:
+            pool.release(command, driver, game_result)
+            log.info('bot_pool', game=uuid, **pool.stats())
+        else:
             driver.kill()
-        finally:
-            response = requests.delete('{}/play/{}'.format(url, uuid))
-            print (response.content)
+        if recorder:
+            driver.listeners.remove(recorder)
+    finally:
+        if recorder:
+            # Also ends failed games so that the writer stops tracking their turns
+            recorder.close()
+            replay.flush()
+        profiling.clear_game()
+        log.info('game_left', game=uuid, response=client.leave(uuid))
+        log.info('api_stats', stats=client.stats())
+
+def make_driver(command, options, cache=None):
+    return FrameDriver(command, options.minimal_frames, options.frame_timeout, cache)
+
+def make_cache(options):
+    if not (options.cache_size or options.book):
+        return None
+    cache = DecisionCache(options.cache_size or DEFAULT_CAPACITY)
+    if options.book:
+        cache.load(options.book)
+    return cache
+
+def main(command, url, options):
+    client = PanelClient(url)
+    feed = Feed(options.feed) if options.feed else None
+    replay = ReplayWriter(options.replay) if options.replay else None
+    cache = make_cache(options)
+    pool = None
+    if options.warm:
+        pool = BotPool(options.warm, lambda executable: make_driver(executable, options, cache))
+        pool.warm(command)
+    restart = False
+    while True:
+        if restart:
+            stats.inc('bridge_restarts_total', bot=os.path.basename(command))
+            sleep(1)
+        run_game(command, client, options, pool, replay, cache, feed)
+        restart = True
+
+def add_bridge_arguments(parser):
+    parser.add_argument('--autojoin', action='store_true')
+    parser.add_argument('--warm', type=int, default=0, help='Number of processes per bot to keep booted and reuse between games')
+    parser.add_argument('--minimal-frames', action='store_true', help='Only send the frames that carry an event to the bots')
+    parser.add_argument('--log-level', choices=sorted(bridgelog.LEVELS), default='info')
+    parser.add_argument('--boards', action='store_true', help='Render frames as ASCII boards in the debug log')
+    parser.add_argument('--replay', type=str, help='Record panel states and frames of all games to this indexed replay log')
+    parser.add_argument('--frame-timeout', type=float, help='Seconds a bot may take to acknowledge a frame before it is restarted')
+    parser.add_argument('--decision-timeout', type=float, help='Seconds a bot may take to decide a move, capped by the server turn limit')
+    parser.add_argument('--cache-size', type=int, default=0, help='Answer repeated positions from a per-bot cache of this many decisions instead of asking the bots')
+    parser.add_argument('--book', type=str, help='Opening book built with decision_cache.py to seed the decision caches with')
+    parser.add_argument('--feed', type=str, help='Publish frames for dashboard.py to this udp:[HOST]:PORT or unix:PATH endpoint without ever waiting for it')
+    parser.add_argument('--metrics-port', type=int, help='Serve per-move latency metrics in Prometheus text format on this local port')
+    parser.add_argument('--metrics-file', type=str, help='Periodically dump the metrics in Prometheus text format to this file')
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help='Seconds between metric dumps')
+    parser.add_argument('--profile-dir', type=str, default='.', help='Directory for the profiles toggled with SIGUSR2 or the profile socket')
+    parser.add_argument('--profile-socket', type=str, help='Unix socket accepting start [interval_ms], stop and status to control profiling')
+
+def configure(options):
+    bridgelog.configure(options.log_level, options.boards)
+    metrics.configure(options.metrics_port, options.metrics_file, options.metrics_interval)
+    profiling.configure(options.profile_dir, options.profile_socket)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Connection layer between a HTTP API and a subprocess pipe')
-    parser.add_argument('command', metavar='command', type=str, help='Executable for the puyoai bot')
+    parser.add_argument('command', metavar='command', type=str, help='Executable for the puyoai bot, or unix:PATH or tcp:[HOST]:PORT of a botd')
     parser.add_argument('url', metavar='url', type=str, help='API URL')
-    parser.add_argument('--autojoin', action='store_true')
+    add_bridge_arguments(parser)
 
     args = parser.parse_args()
-    main(args.command, args.url, args.autojoin)
+    configure(args)
+    main(args.command, args.url, args)
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+import argparse
+import errno
+import fcntl
+import os
+import select
+import socket
+import struct
+import sys
+import termios
+from collections import OrderedDict
+from time import time
+from json_api import FrameEncoder, FrameRequest, WIDTH, HEIGHT, GHOST_HEIGHT, EMPTY, OJAMA
+from transport import parse_address
+
+DEFAULT_FPS = 15
+# Frames per second and game published to the dashboard, decision frames are always sent
+FEED_RATE = 30
+DATAGRAM_SIZE = 65536
+
+BOARD_ROWS = HEIGHT + GHOST_HEIGHT + 1
+# Every cell is one terminal column: two walls, the field and the next pieces beside it
+BOARD_WIDTH = WIDTH + 4
+PANEL_WIDTH = 2 * BOARD_WIDTH + 3
+PANEL_HEIGHT = BOARD_ROWS + 5
+
+PUYO_CHARS = {EMPTY: " ", OJAMA: "@", 1: "R", 2: "B", 3: "Y", 4: "G"}
+PUYO_COLORS = {OJAMA: "37", 1: "31", 2: "34", 3: "33", 4: "32"}
+
+class Feed(object):
+    def __init__(self, endpoint, rate=FEED_RATE):
+        self.family, self.address = parse_address(endpoint)
+        self.socket = socket.socket(self.family, socket.SOCK_DGRAM)
+        # The bridge never waits for the dashboard, frames nobody can take are dropped
+        self.socket.setblocking(False)
+        self.interval = 1.0 / rate if rate else 0.0
+
+    def publisher(self, uuid, bot):
+        return FeedPublisher(self, uuid, bot)
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data, self.address)
+        except socket.error:
+            pass
+
+class FeedPublisher(object):
+    def __init__(self, feed, uuid, bot):
+        self.feed = feed
+        self.prefix = "{} {} ".format(uuid, bot.replace(" ", "_"))
+        self.encoder = FrameEncoder()
+        self.last = 0.0
+
+    def __call__(self, frame):
+        now = time()
+        if now - self.last < self.feed.interval and not frame.players[0].event and frame.game_result is None:
+            return
+        self.last = now
+        self.feed.send(self.prefix + str(self.encoder.encode(frame)))
+
+def terminal_size(stream):
+    try:
+        rows, cols = struct.unpack("hh", fcntl.ioctl(stream.fileno(), termios.TIOCGWINSZ, "    "))[:2]
+        if rows and cols:
+            return rows, cols
+    except (IOError, AttributeError):
+        pass
+    return int(os.environ.get("LINES", 24)), int(os.environ.get("COLUMNS", 80))
+
+class Screen(object):
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.size = None
+        self.front = []
+        self.back = []
+        self.dirty = set()
+        self.written = 0
+
+    def resize(self, size):
+        self.size = size
+        rows, cols = size
+        self.back = [[" "] * cols for _ in range(rows)]
+        self.front = [[" "] * cols for _ in range(rows)]
+        self.dirty = set()
+        self.stream.write("\x1b[?25l\x1b[0m\x1b[2J")
+
+    def clear(self):
+        for y, row in enumerate(self.back):
+            row[:] = [" "] * len(row)
+            self.dirty.add(y)
+
+    def text(self, y, x, cells):
+        if y >= len(self.back):
+            return
+        row = self.back[y]
+        cells = cells[:max(0, len(row) - x)]
+        row[x:x + len(cells)] = cells
+        self.dirty.add(y)
+
+    def flush(self):
+        # Only the runs of cells that differ from what is on the terminal are written
+        parts = []
+        for y in sorted(self.dirty):
+            back = self.back[y]
+            front = self.front[y]
+            x = 0
+            cols = len(back)
+            while x < cols:
+                if back[x] == front[x]:
+                    x += 1
+                    continue
+                start = x
+                while x < cols and back[x] != front[x]:
+                    x += 1
+                parts.append("\x1b[{};{}H".format(y + 1, start + 1))
+                parts.extend(back[start:x])
+                front[start:x] = back[start:x]
+        self.dirty.clear()
+        if parts:
+            output = "".join(parts)
+            self.written += len(output)
+            self.stream.write(output)
+            self.stream.flush()
+
+    def close(self):
+        rows = self.size[0] if self.size else 1
+        self.stream.write("\x1b[0m\x1b[{};1H\x1b[?25h\n".format(rows))
+        self.stream.flush()
+
+def puyo_cell(puyo, color, falling=False):
+    char = PUYO_CHARS.get(puyo, "?")
+    if falling:
+        char = char.lower()
+    if color and puyo in PUYO_COLORS:
+        return "\x1b[{}m{}\x1b[0m".format(PUYO_COLORS[puyo], char)
+    return char
+
+def board_rows(player, color):
+    field = [EMPTY] * WIDTH + list(player.field)
+    falling = {}
+    if player.kumipuyos and player.kumipuyos[0][0] != EMPTY:
+        kumi_x, kumi_y = player.get_kumi_xy()
+        falling[player.kumipuyo_x, player.kumipuyo_y] = player.kumipuyos[0][0]
+        falling[kumi_x, kumi_y] = player.kumipuyos[0][1]
+    rows = []
+    for y in range(BOARD_ROWS):
+        row = ["|"]
+        for x in range(WIDTH):
+            if (x, y) in falling and not field[x + y * WIDTH]:
+                row.append(puyo_cell(falling[x, y], color, True))
+            else:
+                row.append(puyo_cell(field[x + y * WIDTH], color))
+        row.append("|")
+        # Next pieces are shown beside the board like in render
+        index = y // 3 + 1
+        if y % 3 in (1, 2) and index < len(player.kumipuyos):
+            row.extend([" ", puyo_cell(player.kumipuyos[index][(y % 3) - 1], color)])
+        else:
+            row.extend([" ", " "])
+        rows.append(row)
+    rows.append(list(("+" + "-" * WIDTH + "+").ljust(BOARD_WIDTH)))
+    return rows
+
+def panel_rows(game, color):
+    header = "{} {}".format(game.uuid[:8], game.bot)
+    frame = game.frame
+    if frame is None:
+        return [list(header[:PANEL_WIDTH])]
+    own, opponent = frame.players
+    rows = [list(header[:PANEL_WIDTH].ljust(PANEL_WIDTH))]
+    for left, right in zip(board_rows(own, color), board_rows(opponent, color)):
+        rows.append(left + [" "] + right + [" ", " "])
+    for text in (
+        "S{} O{}".format(own.score, own.ojama)[:BOARD_WIDTH].ljust(BOARD_WIDTH + 1) + "S{} O{}".format(opponent.score, opponent.ojama),
+        "ID={} {}".format(frame.id, own.event.to_string()) if frame.game_result is None else "ID={} END={}".format(frame.id, frame.game_result),
+    ):
+        rows.append(list(text[:PANEL_WIDTH].ljust(PANEL_WIDTH)))
+    return rows
+
+class Game(object):
+    def __init__(self, uuid, bot):
+        self.uuid = uuid
+        self.bot = bot
+        self.payload = None
+        self.frame = None
+        self.seen = 0.0
+        self.dirty = True
+
+class Dashboard(object):
+    def __init__(self, endpoint, fps=DEFAULT_FPS, expire=10.0, color=True, stream=sys.stdout):
+        family, address = parse_address(endpoint)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.socket.bind(address)
+        self.socket.setblocking(False)
+        self.interval = 1.0 / fps
+        self.expire = expire
+        self.color = color
+        self.stream = stream
+        self.screen = Screen(stream)
+        self.games = OrderedDict()
+        self.layout_changed = True
+        self.received = 0
+        self.rate = 0.0
+        self.rate_started = time()
+        self.rate_count = 0
+
+    def receive(self, now):
+        while True:
+            try:
+                data = self.socket.recv(DATAGRAM_SIZE)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            parts = data.split(" ", 2)
+            if len(parts) < 3:
+                continue
+            uuid, bot, payload = parts
+            game = self.games.get(uuid)
+            if game is None:
+                game = self.games[uuid] = Game(uuid, bot)
+                self.layout_changed = True
+            # Only the newest frame of a game is kept and it is parsed when painted
+            game.payload = payload
+            game.seen = now
+            game.dirty = True
+            self.received += 1
+            self.rate_count += 1
+
+    def expire_games(self, now):
+        for uuid, game in self.games.items():
+            if now - game.seen > self.expire:
+                del self.games[uuid]
+                self.layout_changed = True
+
+    def paint(self, now):
+        size = terminal_size(self.stream)
+        if size != self.screen.size:
+            self.screen.resize(size)
+            self.layout_changed = True
+        rows, cols = size
+        per_row = max(1, cols // PANEL_WIDTH)
+        shown = max(1, (rows - 1) // PANEL_HEIGHT) * per_row
+        if self.layout_changed:
+            self.screen.clear()
+        for i, game in enumerate(self.games.values()[:shown]):
+            if not (game.dirty or self.layout_changed):
+                continue
+            if game.payload is not None:
+                try:
+                    game.frame = FrameRequest.from_string(game.payload)
+                except (ValueError, KeyError, IndexError):
+                    pass
+            top = (i // per_row) * PANEL_HEIGHT
+            left = (i % per_row) * PANEL_WIDTH
+            for y, cells in enumerate(panel_rows(game, self.color)):
+                self.screen.text(top + y, left, cells)
+            game.dirty = False
+        self.layout_changed = False
+        elapsed = now - self.rate_started
+        if elapsed >= 1.0:
+            self.rate = self.rate_count / elapsed
+            self.rate_started = now
+            self.rate_count = 0
+        status = "{} games, {} shown, {:.0f} frames/s received, {} bytes painted".format(
+            len(self.games), min(shown, len(self.games)), self.rate, self.screen.written)
+        self.screen.text(rows - 1, 0, list(status[:cols].ljust(cols)))
+        self.screen.flush()
+
+    def run(self):
+        next_paint = time()
+        try:
+            while True:
+                # Frames are drained as they come but the screen is painted at the capped rate only
+                select.select([self.socket], [], [], max(0.0, next_paint - time()))
+                now = time()
+                self.receive(now)
+                if now >= next_paint:
+                    self.expire_games(now)
+                    self.paint(now)
+                    next_paint = max(next_paint + self.interval, now)
+        finally:
+            self.screen.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Watch the games of running bridges started with --feed')
+    parser.add_argument('endpoint', metavar='endpoint', type=str, help='udp:[HOST]:PORT or unix:PATH datagram endpoint to receive frames on')
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS, help='Maximum number of screen repaints per second')
+    parser.add_argument('--expire', type=float, default=10.0, help='Seconds without frames after which a game is removed')
+    parser.add_argument('--no-color', action='store_true', help='Do not color the puyos')
+
+    args = parser.parse_args()
+    try:
+        Dashboard(args.endpoint, args.fps, args.expire, not args.no_color).run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+import argparse
+import hashlib
+import json
+import os
+import string
+import threading
+from collections import OrderedDict
+from json_api import FrameInterpolator, FrameResponse
+from replay import ReplayReader
+from state_view import as_view
+
+DEFAULT_CAPACITY = 65536
+SCORE_BUCKET = 70
+COLOR_CHARS = "4567"
+
+def canonical_colors(puyos):
+    # Relabel colors in order of appearance so that openings differing only in colors share an entry
+    mapping = ""
+    for puyo in puyos:
+        if puyo in COLOR_CHARS and puyo not in mapping:
+            mapping += puyo
+            if len(mapping) == len(COLOR_CHARS):
+                break
+    if not mapping:
+        return puyos
+    return puyos.translate(string.maketrans(mapping, COLOR_CHARS[:len(mapping)]))
+
+def position_key(frame, score_bucket=SCORE_BUCKET):
+    own, opponent = frame.players
+    puyos = canonical_colors("{}|{}|{}".format(own.kumipuyos_string(), own.field_string(), opponent.field_string()))
+    text = "{}|{}|{}|{}|{}".format(puyos, own.ojama, opponent.ojama, own.score // score_bucket, opponent.score // score_bucket)
+    return hashlib.sha1(text).hexdigest()
+
+class DecisionCache(object):
+    def __init__(self, capacity=DEFAULT_CAPACITY, score_bucket=SCORE_BUCKET):
+        self.capacity = capacity
+        self.score_bucket = score_bucket
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, frame):
+        return position_key(frame, self.score_bucket)
+
+    def get(self, key):
+        with self.lock:
+            move = self.entries.pop(key, None)
+            if move is None:
+                self.misses += 1
+                return None
+            # Reinsert to mark the entry as most recently used
+            self.entries[key] = move
+            self.hits += 1
+            return move
+
+    def put(self, key, x, r):
+        if x is None:
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (x, r)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def learn(self, states, max_turn=None):
+        interpolator = FrameInterpolator()
+        key = None
+        deal = None
+        learned = 0
+        for state in states:
+            state = as_view(state)
+            if key is not None and state.own.move is not None:
+                try:
+                    move = FrameResponse.from_blocks(state.own.move, deal, state.width)
+                except ValueError:
+                    move = None
+                if move is not None:
+                    self.put(key, move.x, move.r)
+                    learned += 1
+            key = None
+            if not state.can_play or (max_turn is not None and state.time >= max_turn):
+                break
+            for _ in interpolator.step(state):
+                pass
+            key = self.key(interpolator.last_frame)
+            deal = interpolator.last_frame.players[0].kumipuyos[0]
+        return learned
+
+    def learn_replay(self, path, max_turn=None):
+        reader = ReplayReader(path)
+        learned = 0
+        for game in range(len(reader.uuids)):
+            learned += self.learn(reader.states(game), max_turn)
+        reader.close()
+        return learned
+
+    def load(self, path):
+        with open(path) as f:
+            book = json.load(f)
+        self.score_bucket = book.get("score_bucket", self.score_bucket)
+        for key, x, r in book["entries"]:
+            self.put(key, x, r)
+
+    def save(self, path):
+        with self.lock:
+            entries = [[key, x, r] for key, (x, r) in self.entries.items()]
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"score_bucket": self.score_bucket, "entries": entries}, f, separators=(",", ":"))
+        os.rename(temporary, path)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an opening book for the decision cache from replay logs')
+    parser.add_argument('book', metavar='book', type=str, help='Opening book to write, extended if it exists')
+    parser.add_argument('replays', metavar='replay', type=str, nargs='+', help='Replay logs written with --replay')
+    parser.add_argument('--turns', type=int, default=8, help='Only learn the first N turns of every game')
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY, help='Maximum number of positions in the book')
+
+    args = parser.parse_args()
+    cache = DecisionCache(args.capacity)
+    if os.path.exists(args.book):
+        cache.load(args.book)
+    for path in args.replays:
+        print ("{}: learned {} decisions".format(path, cache.learn_replay(path, args.turns)))
+    cache.save(args.book)
+    print ("{} positions in {}".format(len(cache.entries), args.book))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+import argparse
+import json
+import multiprocessing
+import traceback
+from time import time
+from json_api import FrameDriver
+from metrics import Summary
+from replay import ReplayReader
+from state_view import as_view
+
+_commands = None
+_minimal = False
+_drivers = None
+_readers = {}
+
+def init_worker(commands, minimal):
+    global _commands, _minimal, _drivers
+    _commands = commands
+    _minimal = minimal
+    # Every worker boots its own bots once and keeps them for all the games it is given
+    _drivers = [FrameDriver(command, minimal) for command in commands]
+
+def get_reader(path):
+    reader = _readers.get(path)
+    if reader is None:
+        reader = _readers[path] = ReplayReader(path)
+    return reader
+
+def respawn(build):
+    _drivers[build].kill()
+    driver = _drivers[build] = FrameDriver(_commands[build], _minimal)
+    return driver
+
+def evaluate_game(task):
+    path, game = task
+    # Decode every position once and share it between the builds
+    states = [state for state in map(as_view, get_reader(path).states(game)) if state.can_play]
+    results = []
+    for build, driver in enumerate(_drivers):
+        for state in states:
+            result = {"game": game, "turn": state.time, "build": build}
+            results.append(result)
+            start = time()
+            try:
+                response = driver.decide(state)
+            except Exception:
+                result["error"] = traceback.format_exc()
+                driver = respawn(build)
+                break
+            result["seconds"] = time() - start
+            result["think"] = driver.think_time
+            result["x"] = response.x
+            result["r"] = response.r
+        try:
+            driver.reset()
+        except Exception:
+            # A bot that cannot finish the game must not fail the task or the next game
+            respawn(build)
+    return results
+
+def evaluate(path, commands, processes=None, minimal=False, games=None):
+    reader = ReplayReader(path)
+    tasks = [(path, game) for game in range(len(reader.uuids))][:games]
+    reader.close()
+    pool = multiprocessing.Pool(processes, init_worker, (commands, minimal))
+    start = time()
+    try:
+        results = [result for results in pool.imap_unordered(evaluate_game, tasks) for result in results]
+    finally:
+        pool.close()
+        pool.join()
+    return results, time() - start
+
+def agreement(results):
+    moves = {}
+    for result in results:
+        if "error" not in result:
+            moves.setdefault((result["game"], result["turn"]), {})[result["build"]] = (result["x"], result["r"])
+    compared = [builds for builds in moves.values() if len(builds) == 2]
+    agreed = sum(1 for builds in compared if builds[0] == builds[1])
+    return agreed, len(compared)
+
+def report(results, commands, elapsed):
+    decisions = [result for result in results if "error" not in result]
+    print ("{} decisions in {:.1f}s, {:.1f} decisions/s, {} errors".format(
+        len(decisions), elapsed, len(decisions) / elapsed if elapsed else 0.0, len(results) - len(decisions)))
+    for build, command in enumerate(commands):
+        for key in ("seconds", "think"):
+            summary = Summary(None)
+            for result in decisions:
+                if result["build"] == build:
+                    summary.observe(result[key])
+            if not summary.count:
+                continue
+            quantiles = " ".join("p{:g}={:.2f}ms".format(q * 100, value * 1000) for q, value in summary.quantiles())
+            print ("{:30} {:7} mean={:.2f}ms {}".format(command, key, summary.total / summary.count * 1000, quantiles))
+    if len(commands) == 2:
+        agreed, compared = agreement(results)
+        print ("agreement {}/{} ({:.1%})".format(agreed, compared, float(agreed) / compared if compared else 0.0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate one or two bot builds on recorded positions in parallel')
+    parser.add_argument('replay', metavar='replay', type=str, help='Replay log written with --replay')
+    parser.add_argument('commands', metavar='command', type=str, nargs='+', help='Executables for the bot builds to compare, at most two')
+    parser.add_argument('--processes', type=int, help='Number of worker processes, defaults to the number of cores')
+    parser.add_argument('--games', type=int, help='Only evaluate the first N games of the log')
+    parser.add_argument('--minimal-frames', action='store_true', help='Only send the frames that carry an event to the bots')
+    parser.add_argument('--output', type=str, help='Save every decision and its timing as JSON')
+
+    args = parser.parse_args()
+    if len(args.commands) > 2:
+        parser.error('at most two bot builds can be compared')
+    results, elapsed = evaluate(args.replay, args.commands, args.processes, args.minimal_frames, args.games)
+    report(results, args.commands, elapsed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f)
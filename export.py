@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+import argparse
+import json
+import multiprocessing
+import os
+from array import array
+from time import time
+from json_api import FrameRequest, FrameResponse, UserEvent, EMPTY, WIDTH, HEIGHT, GHOST_HEIGHT, log_entries, panel_states
+from replay import ReplayReader
+from state_view import as_view
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ROWS = HEIGHT + GHOST_HEIGHT
+CELLS = ROWS * WIDTH
+NUM_DEALS = 3
+NO_MOVE = -1
+CHUNK_SIZE = 1 << 16
+GAMES_PER_TASK = 256
+MANIFEST = "manifest.json"
+
+# Name, array typecode and shape of every position, numpy reads the typecodes as the same dtypes
+COLUMNS = (
+    ("game", "i", ()),
+    ("turn", "i", ()),
+    ("field", "b", (ROWS, WIDTH)),
+    ("opponent_field", "b", (ROWS, WIDTH)),
+    ("deals", "b", (NUM_DEALS, 2)),
+    ("move", "b", (2,)),
+    ("score", "i", (2,)),
+    ("ojama", "i", (2,)),
+    ("events", "B", (2,)),
+)
+
+class Columns(object):
+    def __init__(self):
+        self.values = dict((name, array(typecode)) for name, typecode, shape in COLUMNS)
+        self.rows = 0
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, game, turn, field, opponent_field, deals, score, ojama, events):
+        if len(field) != CELLS or len(opponent_field) != CELLS:
+            raise ValueError("Only {}x{} fields can be exported".format(WIDTH, ROWS))
+        values = self.values
+        values["game"].append(game)
+        values["turn"].append(turn)
+        values["field"].extend(field)
+        values["opponent_field"].extend(opponent_field)
+        deals = list(deals[:NUM_DEALS]) + [(0, 0)] * (NUM_DEALS - len(deals))
+        for deal in deals:
+            values["deals"].extend(deal)
+        values["move"].extend((NO_MOVE, NO_MOVE))
+        values["score"].extend(score)
+        values["ojama"].extend(ojama)
+        values["events"].extend(events)
+        self.rows += 1
+        return self.rows - 1
+
+    def set_move(self, row, move):
+        if move is None or move.x is None:
+            return
+        moves = self.values["move"]
+        moves[2 * row] = move.x
+        moves[2 * row + 1] = move.r
+
+    def to_numpy(self):
+        return dict(
+            (name, numpy.frombuffer(self.values[name], numpy.dtype(typecode)).reshape((self.rows,) + shape))
+            for name, typecode, shape in COLUMNS
+        )
+
+class ChunkWriter(object):
+    def __init__(self, directory, task, chunk_size=CHUNK_SIZE):
+        self.directory = directory
+        self.task = task
+        self.chunk_size = chunk_size
+        self.columns = Columns()
+        self.chunks = []
+        self.rows = 0
+
+    def append(self, *row):
+        # Only flushed before a new row so that the move of the last one can still be filled in
+        if len(self.columns) >= self.chunk_size:
+            self.flush()
+        return self.columns.append(*row)
+
+    def set_move(self, row, move):
+        self.columns.set_move(row, move)
+
+    def flush(self):
+        if not len(self.columns):
+            return
+        name = "{:05d}-{:04d}".format(self.task, len(self.chunks))
+        for column, values in self.columns.to_numpy().items():
+            numpy.save(chunk_path(self.directory, name, column), values)
+        self.chunks.append({"name": name, "rows": len(self.columns)})
+        self.rows += len(self.columns)
+        self.columns = Columns()
+
+def chunk_path(directory, name, column):
+    return os.path.join(directory, "{}.{}.npy".format(name, column))
+
+def state_events(state, child):
+    return UserEvent(False, False, False, state.can_play, False, child.ojama_dropped, child.cleared).mask
+
+def export_states(writer, game, states):
+    pending = None
+    deal = None
+    for state in states:
+        state = as_view(state)
+        own = state.own
+        if pending is not None and own.move is not None:
+            try:
+                writer.set_move(pending, FrameResponse.from_blocks(own.move, deal, state.width))
+            except ValueError:
+                pass
+        pending = None
+        if not state.can_play:
+            continue
+        opponent = state.opponent
+        pending = writer.append(
+            game,
+            state.time,
+            own.blocks,
+            opponent.blocks,
+            state.visible_deals(own),
+            (own.score, opponent.score),
+            (own.ojama, opponent.ojama),
+            (state_events(state, own), state_events(state, opponent)),
+        )
+        deal = state.deal(own.deal_index)
+
+def with_ghost_row(field):
+    # puyoai frame logs leave out the ghost row when it is empty
+    if len(field) == CELLS - WIDTH:
+        return (EMPTY,) * WIDTH + field
+    return field
+
+def export_frames(writer, games, frames):
+    last_id = None
+    pending = None
+    placed = None
+    for payload in frames:
+        frame = FrameRequest.from_string(payload)
+        if last_id is None or frame.id <= last_id:
+            games.append("game-{}".format(len(games)))
+            pending = None
+        last_id = frame.id
+        own, opponent = frame.players
+        if pending is not None and own.event.grounded:
+            # The piece was last seen where the bot put it
+            writer.set_move(pending, placed)
+            pending = None
+        placed = FrameResponse(frame.id, own.kumipuyo_x, own.kumipuyo_r)
+        if not own.event.decicion_request:
+            continue
+        pending = writer.append(
+            len(games) - 1,
+            frame.id,
+            with_ghost_row(own.field),
+            with_ghost_row(opponent.field),
+            own.kumipuyos,
+            (own.score, opponent.score),
+            (own.ojama, opponent.ojama),
+            (own.event.mask, opponent.event.mask),
+        )
+
+def source_kind(path):
+    if os.path.exists(path + ".idx"):
+        return "replay"
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                return "states" if line.startswith("{") else "frames"
+    return "frames"
+
+def make_tasks(paths, games_per_task=GAMES_PER_TASK):
+    tasks = []
+    for path in paths:
+        kind = source_kind(path)
+        if kind == "replay":
+            # Large replay logs are split so that one log still keeps every worker busy
+            reader = ReplayReader(path)
+            num_games = len(reader.uuids)
+            reader.close()
+            for start in range(0, num_games, games_per_task):
+                tasks.append((kind, path, range(start, min(start + games_per_task, num_games))))
+        else:
+            tasks.append((kind, path, None))
+    return tasks
+
+def export_task(task):
+    index, (kind, path, games), directory, chunk_size, player = task
+    writer = ChunkWriter(directory, index, chunk_size)
+    labels = []
+    if kind == "replay":
+        reader = ReplayReader(path)
+        for game in games:
+            labels.append(reader.uuids[game])
+            export_states(writer, len(labels) - 1, reader.states(game))
+        reader.close()
+    else:
+        with open(path) as f:
+            if kind == "states":
+                labels.append(os.path.basename(path))
+                export_states(writer, 0, panel_states(f, player))
+            else:
+                export_frames(writer, labels, log_entries(f))
+    writer.flush()
+    return {"task": index, "source": path, "games": labels, "chunks": writer.chunks, "rows": writer.rows}
+
+def export(paths, directory, processes=None, chunk_size=CHUNK_SIZE, player=0, games_per_task=GAMES_PER_TASK):
+    if numpy is None:
+        raise ImportError("numpy is needed to export game logs")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tasks = [(i, task, directory, chunk_size, player) for i, task in enumerate(make_tasks(paths, games_per_task))]
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = sorted(pool.imap_unordered(export_task, tasks), key=lambda result: result["task"])
+    finally:
+        pool.close()
+        pool.join()
+    manifest = {
+        "columns": [[name, numpy.dtype(typecode).str, list(shape)] for name, typecode, shape in COLUMNS],
+        "tasks": results,
+    }
+    temporary = os.path.join(directory, MANIFEST + ".tmp")
+    with open(temporary, "w") as f:
+        json.dump(manifest, f)
+    os.rename(temporary, os.path.join(directory, MANIFEST))
+    return manifest
+
+def load(directory, columns=None, mmap=True):
+    if numpy is None:
+        raise ImportError("numpy is needed to load exported game logs")
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    shapes = dict((name, (numpy.dtype(dtype), tuple(shape))) for name, dtype, shape in manifest["columns"])
+    names = columns or [name for name, dtype, shape in manifest["columns"]]
+    parts = dict((name, []) for name in names)
+    games = []
+    for task in manifest["tasks"]:
+        offset = len(games)
+        for chunk in task["chunks"]:
+            for name in names:
+                values = numpy.load(chunk_path(directory, chunk["name"], name), mmap_mode="r" if mmap else None)
+                if name == "game" and offset:
+                    # Games are numbered per task in the chunks
+                    values = values + offset
+                parts[name].append(values)
+        games.extend((task["source"], label) for label in task["games"])
+    result = {}
+    for name in names:
+        dtype, shape = shapes[name]
+        if not parts[name]:
+            result[name] = numpy.zeros((0,) + shape, dtype)
+        elif len(parts[name]) == 1:
+            result[name] = parts[name][0]
+        else:
+            result[name] = numpy.concatenate(parts[name])
+    return result, games
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export game logs to memory-mappable NumPy columns for bulk analysis')
+    parser.add_argument('output', metavar='output', type=str, help='Directory to write the .npy chunks and their manifest to')
+    parser.add_argument('logs', metavar='log', type=str, nargs='+', help='Replay logs, panel-league JSON state logs or puyoai frame logs')
+    parser.add_argument('--processes', type=int, help='Number of worker processes, defaults to the number of cores')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Maximum number of positions per chunk')
+    parser.add_argument('--games-per-task', type=int, default=GAMES_PER_TASK, help='Number of games of a replay log converted by one worker at a time')
+    parser.add_argument('--player', type=int, default=0, help='Player whose view is exported from JSON state logs')
+
+    args = parser.parse_args()
+    if numpy is None:
+        parser.error('numpy is needed to export game logs')
+    start = time()
+    manifest = export(args.logs, args.output, args.processes, args.chunk_size, args.player, args.games_per_task)
+    elapsed = time() - start
+    rows = sum(task["rows"] for task in manifest["tasks"])
+    games = sum(len(task["games"]) for task in manifest["tasks"])
+    print ("{} positions of {} games in {:.1f}s".format(rows, games, elapsed))
+    start = time()
+    load(args.output)
+    print ("loaded in {:.2f}s".format(time() - start))
@@ -1,14 +1,22 @@
 #!/usr/bin/env python
-import struct
 import sys
-import subprocess
+import threading
+import Queue
 import json
+import random
+import timeit
 from collections import defaultdict
-from time import sleep
+from time import sleep, time
+import move_codec
+from bridgelog import log
+from state_view import as_view
+from transport import open_transport
 
 P1_WIN = 1
 DRAW = 0
 P2_WIN = -1
+# Seconds a bot may take to acknowledge the end of a game before it is recycled
+RESET_TIMEOUT = 5.0
 
 EMPTY = 0
 OJAMA = -1
@@ -19,6 +27,8 @@ WIDTH = 6
 HEIGHT = 12
 GHOST_HEIGHT = 1
 
+EVENT_FLAGS = "WGPDAOE"
+
 def chunks(l, n):
     return [l[i:i + n] for i in range(0, len(l), n)]
 
@@ -53,10 +63,10 @@ def render_kumipuyo(kumipuyo, puyo):
     return render_puyo(kumipuyo)[0] + flag
 
 def field_from_string(payload):
-    return list(map(puyo_to_int, payload))
+    return tuple(map(puyo_to_int, payload))
 
 def kumipuyos_from_string(payload):
-    return list(map(puyo_to_int, chunk) for chunk in chunks(payload, 2))
+    return tuple(tuple(map(puyo_to_int, chunk)) for chunk in chunks(payload, 2))
 
 def field_to_string(field):
     return "".join(map(puyo_from_int, field))
@@ -68,45 +78,73 @@ def kumipuyos_to_string(kumipuyos):
             result += puyo_from_int(puyo)
     return result
 
+def event_flag(bit):
+    def getter(self):
+        return bool(self.mask & bit)
+
+    def setter(self, value):
+        if value:
+            self.mask |= bit
+        else:
+            self.mask &= ~bit
+
+    return property(getter, setter)
+
+EVENT_STRINGS = [
+    "".join(flag if mask & (1 << i) else "-" for i, flag in enumerate(EVENT_FLAGS))
+    for mask in range(1 << len(EVENT_FLAGS))
+]
+
 class UserEvent(object):
+    __slots__ = ("mask",)
+
+    next_appeared = event_flag(1 << 0)
+    grounded = event_flag(1 << 1)
+    pre_decision_request = event_flag(1 << 2)
+    decicion_request = event_flag(1 << 3)
+    decicion_request_again = event_flag(1 << 4)
+    ojama_dropped = event_flag(1 << 5)
+    puyo_erased = event_flag(1 << 6)
+
     def __init__(self, next_appeared, grounded, pre_decision_request, decicion_request, decicion_request_again, ojama_dropped, puyo_erased):
-        self.next_appeared = next_appeared
-        self.grounded = grounded
-        self.pre_decision_request = pre_decision_request
-        self.decicion_request = decicion_request
-        self.decicion_request_again = decicion_request_again
-        self.ojama_dropped = ojama_dropped
-        self.puyo_erased = puyo_erased
+        self.mask = 0
+        flags = (next_appeared, grounded, pre_decision_request, decicion_request, decicion_request_again, ojama_dropped, puyo_erased)
+        for i, value in enumerate(flags):
+            if value:
+                self.mask |= 1 << i
 
     def to_string(self):
-        result = ""
-        flags = [
-            ("W", self.next_appeared),
-            ("G", self.grounded),
-            ("P", self.pre_decision_request),
-            ("D", self.decicion_request),
-            ("A", self.decicion_request_again),
-            ("O", self.ojama_dropped),
-            ("E", self.puyo_erased),
-        ]
-        for flag, value in flags:
-            result += flag if value else "-"
-        return result
+        return EVENT_STRINGS[self.mask]
 
     def __nonzero__(self):
-        return (self.to_string() != "-------")
+        return self.mask != 0
+
+    def copy(self):
+        return self.from_mask(self.mask)
+
+    @classmethod
+    def from_mask(cls, mask):
+        event = cls.__new__(cls)
+        event.mask = mask
+        return event
 
     @classmethod
     def from_string(cls, payload):
-        args = []
-        for flag in payload:
-            args.append(flag != "-")
-        return cls(*args)
+        mask = 0
+        for i, flag in enumerate(payload):
+            if flag != "-":
+                mask |= 1 << i
+        return cls.from_mask(mask)
 
 class PlayerFrameRequest(object):
+    __slots__ = (
+        "_field", "_field_string", "_kumipuyos", "_kumipuyos_string",
+        "score", "kumipuyo_x", "kumipuyo_y", "kumipuyo_r", "ojama", "event",
+    )
+
     def __init__(self, field, kumipuyos, score, kumipuyo_x, kumipuyo_y, kumipuyo_r, ojama, event):
         self.field = field
-        self.kumipuyos = kumipuyos
+        self.kumipuyos = tuple(map(tuple, kumipuyos))
         self.score = score
         self.kumipuyo_x = kumipuyo_x
         self.kumipuyo_y = kumipuyo_y
@@ -114,6 +152,37 @@ class PlayerFrameRequest(object):
         self.ojama = ojama
         self.event = event
 
+    @property
+    def field(self):
+        return self._field
+
+    @field.setter
+    def field(self, field):
+        # Immutable so that the cached string can only go stale through this setter
+        if not isinstance(field, tuple):
+            field = tuple(field)
+        self._field = field
+        self._field_string = None
+
+    @property
+    def kumipuyos(self):
+        return self._kumipuyos
+
+    @kumipuyos.setter
+    def kumipuyos(self, kumipuyos):
+        self._kumipuyos = kumipuyos
+        self._kumipuyos_string = None
+
+    def field_string(self):
+        if self._field_string is None:
+            self._field_string = field_to_string(self._field)
+        return self._field_string
+
+    def kumipuyos_string(self):
+        if self._kumipuyos_string is None:
+            self._kumipuyos_string = kumipuyos_to_string(self._kumipuyos)
+        return self._kumipuyos_string
+
     def get_kumi_xy(self):
         kumi_x = self.kumipuyo_x
         kumi_y = self.kumipuyo_y
@@ -137,36 +206,62 @@ class PlayerFrameRequest(object):
             return False
         return True
 
+    def landing_y(self):
+        field = self.field
+        rows = len(field) // WIDTH
+        kumi_x, kumi_y = self.get_kumi_xy()
+        landing = rows
+        for x, y in ((self.kumipuyo_x, self.kumipuyo_y), (kumi_x, kumi_y)):
+            floor = y + 1
+            while floor < rows and not field[x + floor * WIDTH]:
+                floor += 1
+            landing = min(landing, self.kumipuyo_y + floor - 1 - y)
+        return max(self.kumipuyo_y, landing)
+
+    def copy(self):
+        result = self.__class__.__new__(self.__class__)
+        # Fields and deals are tuples so they can be shared between copies
+        result._field = self._field
+        result._field_string = self._field_string
+        result._kumipuyos = self._kumipuyos
+        result._kumipuyos_string = self._kumipuyos_string
+        result.score = self.score
+        result.kumipuyo_x = self.kumipuyo_x
+        result.kumipuyo_y = self.kumipuyo_y
+        result.kumipuyo_r = self.kumipuyo_r
+        result.ojama = self.ojama
+        result.event = self.event.copy()
+        return result
+
     def render(self):
-        result = "event={}, score={}, ojama={}\n".format(self.event.to_string(), self.score, self.ojama)
+        parts = ["event={}, score={}, ojama={}\n".format(self.event.to_string(), self.score, self.ojama)]
         kumi_x, kumi_y = self.get_kumi_xy()
-        for i, puyo in enumerate([EMPTY] * WIDTH + self.field):
+        for i, puyo in enumerate([EMPTY] * WIDTH + list(self.field)):
             x = i % WIDTH
-            y = i / WIDTH
-            if i % WIDTH == 0:
-                result += "# "
+            y = i // WIDTH
+            if x == 0:
+                parts.append("# ")
             if x == self.kumipuyo_x and y == self.kumipuyo_y:
-                result += render_kumipuyo(self.kumipuyos[0][0], puyo)
+                parts.append(render_kumipuyo(self.kumipuyos[0][0], puyo))
             elif x == kumi_x and y == kumi_y:
-                result += render_kumipuyo(self.kumipuyos[0][1], puyo)
+                parts.append(render_kumipuyo(self.kumipuyos[0][1], puyo))
             else:
-                result += render_puyo(puyo)
-            if i % WIDTH == WIDTH - 1:
-                result += "#"
+                parts.append(render_puyo(puyo))
+            if x == WIDTH - 1:
+                parts.append("#")
                 if y % 2 == 1:
                     index = y // 2 + 1
                     if index < len(self.kumipuyos):
-                        result += "   "
-                        for kumipuyo in self.kumipuyos[index]:
-                            result += render_puyo(kumipuyo)
-                result += "\n"
-
-        return result + "#" * (2 * WIDTH + 3)
+                        parts.append("   ")
+                        parts.extend(render_puyo(kumipuyo) for kumipuyo in self.kumipuyos[index])
+                parts.append("\n")
+        parts.append("#" * (2 * WIDTH + 3))
+        return "".join(parts)
 
     def to_params(self):
         params = dict()
-        params["F"] = field_to_string(self.field)
-        params["P"] = kumipuyos_to_string(self.kumipuyos)
+        params["F"] = self.field_string()
+        params["P"] = self.kumipuyos_string()
         params["S"] = str(self.score)
         params["X"] = str(self.kumipuyo_x + 1)
         params["Y"] = str(-(self.kumipuyo_y - HEIGHT - GHOST_HEIGHT))
@@ -202,7 +297,13 @@ class PlayerFrameRequest(object):
         deals = global_deals[index:index + num_deals]
         return cls(state["blocks"], deals, state["totalScore"], 2, 1, 0, state["incomingNuisance"], UserEvent.from_string("-------"))
 
+    @classmethod
+    def from_view(cls, child, deals):
+        return cls(child.blocks, deals, child.score, 2, 1, 0, child.ojama, UserEvent.from_mask(0))
+
 class FrameRequest(object):
+    __slots__ = ("id", "players", "game_result", "match_end")
+
     def __init__(self, id, players, game_result=None, match_end=None):
         self.id = id
         self.players = players
@@ -210,23 +311,20 @@ class FrameRequest(object):
         self.match_end = match_end
 
     def render(self):
-        result = ""
-        result += "ID={}, END={}, MATCHEND={}\n".format(self.id, self.game_result, self.match_end)
+        parts = ["ID={}, END={}, MATCHEND={}\n".format(self.id, self.game_result, self.match_end)]
         player_screens = [p.render() for p in self.players]
         for rows in zip(*[screen.split("\n") for screen in player_screens]):
-            result += rows[0]
-            result += " " * (40 - len(rows[0]))
-            result += rows[1]
-            result += "\n"
-
-        return result
+            parts.append(rows[0].ljust(40))
+            parts.append(rows[1])
+            parts.append("\n")
+        return "".join(parts)
 
     def to_string(self):
         result = "ID={} ".format(self.id)
-        if self.game_result:
+        if self.game_result is not None:
             result += "END={} ".format(self.game_result)
-        if self.match_end:
-            result += "MATCHEND={} ".format(self.match_end)
+        if self.match_end is not None:
+            result += "MATCHEND={} ".format(int(self.match_end))
         for prefix, player in [("Y", self.players[0]), ("O", self.players[1])]:
             for key, value in player.to_params().items():
                 result += "{}{}={} ".format(prefix, key, value)
@@ -261,15 +359,44 @@ class FrameRequest(object):
 
     @classmethod
     def from_json(cls, state):
-        player = state["player"]
-        state["childStates"] = [state["childStates"][player], state["childStates"][1 - player]]
-        players = [PlayerFrameRequest.from_json(child, state["deals"], state["numDeals"]) for child in  state["childStates"]]
-        return cls(state["time"] + 1, players)
+        return cls.from_view(as_view(state))
+
+    @classmethod
+    def from_view(cls, view):
+        players = [PlayerFrameRequest.from_view(child, view.visible_deals(child)) for child in (view.own, view.opponent)]
+        return cls(view.time + 1, players)
 
     def copy(self):
-        return self.__class__.from_string(self.to_string())
+        return self.__class__(self.id, [player.copy() for player in self.players], self.game_result, self.match_end)
+
+class FrameEncoder(object):
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def encode(self, frame):
+        buffer = self.buffer
+        del buffer[:]
+        buffer += "ID={}".format(frame.id)
+        if frame.game_result is not None:
+            buffer += " END={}".format(frame.game_result)
+        if frame.match_end is not None:
+            buffer += " MATCHEND={}".format(int(frame.match_end))
+        for prefix, player in zip("YO", frame.players):
+            buffer += " {0}F={1} {0}P={2}".format(prefix, player.field_string(), player.kumipuyos_string())
+            buffer += " {0}S={1} {0}X={2} {0}Y={3} {0}R={4} {0}O={5} {0}E={6}".format(
+                prefix,
+                player.score,
+                player.kumipuyo_x + 1,
+                HEIGHT + GHOST_HEIGHT - player.kumipuyo_y,
+                player.kumipuyo_r,
+                player.ojama,
+                player.event.to_string(),
+            )
+        return buffer
 
 class FrameResponse(object):
+    __slots__ = ("id", "x", "r", "pre_x", "pre_r", "message", "mawashi_area")
+
     def __init__(self, id=None, x=None, r=None, pre_x=None, pre_r=None, message=None, mawashi_area=None):
         self.id = id
         self.x = x
@@ -279,42 +406,19 @@ class FrameResponse(object):
         self.message = message
         self.mawashi_area = mawashi_area
 
-    def to_blocks(self, deal):
+    def to_blocks(self, deal, width=WIDTH):
         if self.x is None:
-            return deal + [EMPTY] * (WIDTH - 2)
-        blocks = [EMPTY] * (WIDTH * 3)
-        blocks[self.x + WIDTH] = deal[0]
-        if self.r == 0:
-            blocks[self.x] = deal[1]
-        elif self.r == 1:
-            blocks[self.x + 1 + WIDTH] = deal[1]
-        elif self.r == 2:
-            blocks[self.x + 2 * WIDTH] = deal[1]
-        else:
-            blocks[self.x - 1 + WIDTH] = deal[1]
-        return blocks
+            return list(deal) + [EMPTY] * (width - 2)
+        return move_codec.encode(self.x, self.r, deal, width)
 
     @classmethod
-    def from_blocks(cls, blocks, deal):
-        for x in range(WIDTH):
-            for r in range(4):
-                candidate = cls(x=x, r=r)
-                b = candidate.to_blocks(deal)
-                if len(blocks) == 2 * WIDTH:
-                    if r == 0:
-                        b = b[:-WIDTH]
-                    else:
-                        b = b[WIDTH:]
-                elif len(blocks) == WIDTH:
-                    b = b[WIDTH:-WIDTH]
-                if b == blocks:
-                    return candidate
-        print deal, blocks, "Cannot resolve blocks :("
-        return cls(x=0, r=0)
-        # raise ValueError("Cannot resolve blocks")
+    def from_blocks(cls, blocks, deal, width=WIDTH):
+        x, r = move_codec.decode(blocks, deal, width)
+        return cls(x=x, r=r)
 
     @classmethod
     def from_string(cls, payload):
+        id = None
         x = None
         r = None
         pre_x = None
@@ -337,46 +441,53 @@ class FrameResponse(object):
                 message = value
             elif key == "MA":
                 mawashi_area = value
+        if id is None:
+            raise ValueError("Response without an ID: {}".format(payload))
         return cls(id, x, r, pre_x, pre_r, message, mawashi_area)
 
 class FrameInterpolator(object):
-    def __init__(self):
+    def __init__(self, minimal=False):
         self.id = 0
         self.last_frame = None
+        self.synced = False
+        # Only send the frames that carry an event, puyoai bots ignore the animation in between
+        self.minimal = minimal
 
     def step(self, target):
-        if self.last_frame is None:
-            for frame in self.first_frames(target):
-                yield frame
+        target = as_view(target)
+        if not self.synced:
+            frames = self.first_frames(target)
         else:
-            for frame in self.second_frames(target):
-                yield frame
+            frames = self.second_frames(target)
+        for frame in frames:
+            if self.minimal and not any(player.event for player in frame.players):
+                continue
+            self.id += 1
+            frame.id = self.id
+            yield frame
         self.last_frame = frame.copy()
+        self.synced = True
+
+    def resync(self):
+        # The next state is sent as if the bot joined the game there, frame IDs keep counting
+        self.synced = False
 
     def first_frames(self, target):
-        frame = FrameRequest.from_json(target)
-        self.id += 1
-        frame.id = self.id
+        frame = FrameRequest.from_view(target)
         for player in frame.players:
-            player.kumipuyos = [(EMPTY, EMPTY)] + player.kumipuyos[:-1]
+            player.kumipuyos = ((EMPTY, EMPTY),) + player.kumipuyos[:-1]
         yield frame.copy()
 
-        self.id += 1
-        frame.id = self.id
         for player in frame.players:
             player.event.next_appeared = True
         yield frame.copy()
 
-        self.id += 1
-        frame.id = self.id
         for player in frame.players:
             player.event.next_appeared = False
             player.event.grounded = True
             player.kumipuyos = player.kumipuyos[1:]
         yield frame.copy()
 
-        self.id += 1
-        frame.id = self.id
         for player in frame.players:
             player.event.next_appeared = False
             player.event.grounded = False
@@ -384,116 +495,275 @@ class FrameInterpolator(object):
         yield frame.copy()
 
     def second_frames(self, target):
+        width = target.width
         frame = self.last_frame.copy()
         moves = [None, None]
         ojamas_dropped = [False, False]
         puyos_erased = [False, False]
-        for child in target["childStates"]:
-            index = 1 - (child["player"] == target["player"])
-            deal = frame.players[child["player"]].kumipuyos[0]
-            blocks = deal + [EMPTY] * (2 * WIDTH - 2)
-            for event in child["events"]:
-                if "blocks" in event:
-                    blocks = event["blocks"]
-            moves[index] = FrameResponse.from_blocks(blocks, deal)
-            for effect in child["effects"]:
-                if effect["type"] == "groupCleared":
-                    puyos_erased[index] = True
-                elif effect["type"] == "puyoDropped" and effect["color"] == OJAMA:
-                    ojamas_dropped[index] = True
+        for child in target.children:
+            index = 1 - (child.player == target.player)
+            deal = frame.players[child.player].kumipuyos[0]
+            blocks = child.move
+            if blocks is None:
+                blocks = list(deal) + [EMPTY] * (2 * width - 2)
+            moves[index] = FrameResponse.from_blocks(blocks, deal, width)
+            puyos_erased[index] = child.cleared
+            ojamas_dropped[index] = child.ojama_dropped
         for player, move in zip(frame.players, moves):
             player.event.decicion_request = False
             player.kumipuyo_x = move.x
             player.kumipuyo_r = move.r
 
-        while True:
-            self.id += 1
-            frame.id = self.id
-            yield frame.copy()
-            done = 0
-            for player in frame.players:
-                player.kumipuyo_y += 1
-                if not player.kumi_free():
-                    player.kumipuyo_y -= 1
-                    done += 1
-            if done == 2:
-                break
+        landings = [player.landing_y() for player in frame.players]
+        if not self.minimal:
+            starts = [player.kumipuyo_y for player in frame.players]
+            for i in range(max(landing - start for start, landing in zip(starts, landings)) + 1):
+                for player, start, landing in zip(frame.players, starts, landings):
+                    player.kumipuyo_y = min(start + i, landing)
+                yield frame.copy()
+        for player, landing in zip(frame.players, landings):
+            player.kumipuyo_y = landing
 
-        self.id += 1
-        frame.id = self.id
         for player, ojama_dropped in zip(frame.players, ojamas_dropped):
             player.event.ojama_dropped = ojama_dropped
         yield frame.copy()
 
         # Next round
 
-        target_frame = FrameRequest.from_json(target)
+        target_frame = FrameRequest.from_view(target)
         frame = target_frame.copy()
-        self.id += 1
-        frame.id = self.id
         for player in frame.players:
             player.kumipuyos = player.kumipuyos[:-1]
             player.event.grounded = True
         yield frame.copy()
 
-        self.id += 1
-        frame.id = self.id
         for player, puyo_erased in zip(frame.players, puyos_erased):
             player.event.grounded = False
             player.event.puyo_erased = puyo_erased
         yield frame.copy()
 
-        self.id += 1
-        frame.id = self.id
         for player in frame.players:
             player.event.puyo_erased = False
         yield frame.copy()
 
-        self.id += 1
         frame = target_frame.copy()
-        frame.id = self.id
         for player in frame.players:
             player.event.next_appeared = True
         yield frame.copy()
 
-        self.id += 1
-        frame.id = self.id
         for player in frame.players:
             player.event.grounded = False
             player.event.next_appeared = False
             player.event.decicion_request = True
         yield frame.copy()
 
+    def pre_decision_frame(self, move):
+        frame = self.last_frame.copy()
+        self.id += 1
+        frame.id = self.id
+        for player in frame.players:
+            player.event.decicion_request = False
+        player = frame.players[0]
+        player.kumipuyo_x = move.x
+        player.kumipuyo_r = move.r
+        player.event.pre_decision_request = True
+        return frame
+
+    def end_frame(self, game_result, match_end=True):
+        frame = self.last_frame.copy()
+        self.id += 1
+        frame.id = self.id
+        frame.game_result = game_result
+        frame.match_end = match_end
+        for player in frame.players:
+            player.event = UserEvent.from_string("-------")
+        return frame
+
+class BotTimeout(Exception):
+    pass
+
+class BotProtocolError(Exception):
+    pass
+
 class Driver(object):
-    def __init__(self, executable):
-        self.process = subprocess.Popen([executable], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    def __init__(self, executable, frame_timeout=None):
+        self.executable = executable
+        self.frame_timeout = frame_timeout
+        self.restarts = 0
+        self.start()
+
+    def start(self):
+        # The executable is either a bot to launch or a unix:/tcp: endpoint of a running botd
+        self.transport = open_transport(self.executable)
+        self.responses = Queue.Queue()
+        self.reader = threading.Thread(target=self.read_responses, args=(self.transport, self.responses))
+        self.reader.daemon = True
+        self.reader.start()
+
+    def read_responses(self, transport, responses):
+        try:
+            while True:
+                responses.put(transport.read_message())
+        except (EOFError, IOError, ValueError):
+            pass
+        responses.put(None)
 
     def send(self, payload):
-        header = struct.pack("I", len(payload))
-        self.process.stdin.write(header)
-        self.process.stdin.write(payload)
-        self.process.stdin.flush()
+        self.transport.send(payload)
 
-    def receive(self):
-        header = self.process.stdout.read(struct.calcsize("I"))
-        size = struct.unpack("I", header)[0]
-        return self.process.stdout.read(size)
+    def receive(self, timeout=None):
+        try:
+            if timeout is None:
+                response = self.responses.get()
+            else:
+                response = self.responses.get(timeout=max(timeout, 0))
+        except Queue.Empty:
+            raise BotTimeout("Bot did not answer within {:.3f}s".format(timeout))
+        if response is None:
+            # Leave the marker in place for anyone else waiting on a dead bot
+            self.responses.put(None)
+            raise EOFError("Bot closed its output")
+        return response
+
+    def alive(self):
+        return self.transport.alive()
 
     def kill(self):
-        self.process.kill()
+        self.reap(self.transport, self.reader)
+
+    def restart(self):
+        # The new bot boots while the old one is reaped in the background
+        transport, reader = self.transport, self.reader
+        self.start()
+        self.restarts += 1
+        reaper = threading.Thread(target=self.reap, args=(transport, reader))
+        reaper.daemon = True
+        reaper.start()
+
+    @staticmethod
+    def reap(transport, reader):
+        transport.close()
+        reader.join()
 
 class FrameDriver(Driver):
-    def __init__(self, executable):
-        super(FrameDriver, self).__init__(executable)
-        self.interpolator = FrameInterpolator()
+    def __init__(self, executable, minimal=False, frame_timeout=None, cache=None):
+        super(FrameDriver, self).__init__(executable, frame_timeout)
+        self.minimal = minimal
+        self.cache = cache
+        self.interpolator = FrameInterpolator(minimal)
+        self.encoder = FrameEncoder()
+        self.pre_decision_id = None
+        self.pre_decision = None
+        self.acknowledged = 0
+        self.predictions = 0
+        self.prediction_hits = 0
+        self.interpolate_time = 0.0
+        self.think_time = 0.0
+        self.listeners = []
+
+    def send_frame(self, frame):
+        for listener in self.listeners:
+            listener(frame)
+        self.send(self.encoder.encode(frame))
+
+    def wait_for(self, id, deadline=None, decision=False):
+        while True:
+            # Every frame is acknowledged so a silent bot is caught after one frame budget
+            timeout = self.frame_timeout
+            if decision and self.acknowledged >= id - 1:
+                # Only the decision is outstanding and the bot may think for as long as the deadline allows
+                timeout = None
+            if deadline is not None:
+                remaining = deadline - time()
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            message = self.receive(timeout)
+            try:
+                response = FrameResponse.from_string(message)
+            except ValueError:
+                raise BotProtocolError("Bot answered {!r}".format(message))
+            self.acknowledged = max(self.acknowledged, response.id)
+            if response.id == self.pre_decision_id:
+                self.pre_decision = response
+            if response.id == id:
+                return response
+            elif response.id > id:
+                raise BotProtocolError("Bot answered {} while waiting for frame {}".format(response.id, id))
+
+    def decide(self, state, timeout=None):
+        # Acknowledgements of the intermediate frames are drained by the reader thread
+        start = time()
+        frame = None
+        # Hold back one frame so that the decision request can still be answered from the cache
+        for next_frame in self.interpolator.step(state):
+            if frame is not None:
+                log.debug("frame", frame=frame)
+                self.send_frame(frame)
+            frame = next_frame
+        key = None
+        cached = None
+        if self.cache is not None:
+            key = self.cache.key(frame)
+            cached = self.cache.get(key)
+        if cached is not None:
+            # The bot still follows the game but is not asked to think about it
+            for player in frame.players:
+                player.event.decicion_request = False
+        log.debug("frame", frame=frame)
+        self.send_frame(frame)
+        sent = time()
+        self.interpolate_time = sent - start
+        if cached is not None:
+            self.think_time = 0.0
+            self.pre_decision_id = None
+            self.pre_decision = None
+            return FrameResponse(frame.id, cached[0], cached[1])
+        response = self.wait_for(frame.id, start + timeout if timeout is not None else None, True)
+        self.think_time = time() - sent
+        if key is not None:
+            self.cache.put(key, response.x, response.r)
+        if self.pre_decision is not None:
+            self.predictions += 1
+            if (self.pre_decision.pre_x, self.pre_decision.pre_r) == (response.x, response.r):
+                self.prediction_hits += 1
+        self.pre_decision_id = None
+        self.pre_decision = None
+        return response
+
+    def pre_decide(self, move):
+        # Let the bot think about the next deal while we wait for the server
+        last_frame = self.interpolator.last_frame
+        if move.x is None or not self.interpolator.synced or len(last_frame.players[0].kumipuyos) < 2:
+            return
+        frame = self.interpolator.pre_decision_frame(move)
+        self.send_frame(frame)
+        self.pre_decision_id = frame.id
 
     def play(self, state):
-        for frame in self.interpolator.step(state):
-            print frame.render()
-            self.send(frame.to_string())
-            response = self.receive()
-            kumipuyos = frame.players[0].kumipuyos[0]
-        return FrameResponse.from_string(response).to_blocks(kumipuyos)
+        response = self.decide(state)
+        return response.to_blocks(self.interpolator.last_frame.players[0].kumipuyos[0])
+
+    def resync(self):
+        self.interpolator.resync()
+        self.pre_decision_id = None
+        self.pre_decision = None
+
+    def reset(self, game_result=DRAW, timeout=RESET_TIMEOUT):
+        if self.interpolator.last_frame is not None:
+            frame = self.interpolator.end_frame(game_result)
+            self.send_frame(frame)
+            self.wait_for(frame.id, time() + timeout)
+        self.interpolator = FrameInterpolator(self.minimal)
+        self.acknowledged = 0
+        self.pre_decision_id = None
+        self.pre_decision = None
+
+    def restart(self):
+        super(FrameDriver, self).restart()
+        # The new bot joins the game at the current state
+        self.interpolator = FrameInterpolator(self.minimal)
+        self.acknowledged = 0
+        self.pre_decision_id = None
+        self.pre_decision = None
 
 
 def test_framerequest_parse():
@@ -533,38 +803,137 @@ def test_interpolation():
     for frame in interpolator.step(json.loads(payload)):
         print frame.to_string()
 
-def render_log(data):
-    for payload in data.split("\n"):
-        payload = payload.strip()
-        if not payload:
-            continue
+def make_test_states(turns=10, seed=1):
+    rng = random.Random(seed)
+    rows = HEIGHT + GHOST_HEIGHT
+    deals = [[rng.randint(1, 4), rng.randint(1, 4)] for _ in range(turns + 3)]
+    fields = [[EMPTY] * (WIDTH * rows) for _ in range(2)]
+    events = [[], []]
+    states = []
+    for time in range(turns):
+        children = []
+        for player, field in enumerate(fields):
+            children.append({
+                "player": player,
+                "blocks": list(field),
+                "totalScore": 0,
+                "incomingNuisance": 0,
+                "dealIndex": time,
+                "events": events[player],
+                "effects": [],
+            })
+        states.append({
+            "time": time,
+            "player": 0,
+            "width": WIDTH,
+            "numDeals": 3,
+            "childStates": children,
+            "deals": deals[:time + 3],
+        })
+        for player, field in enumerate(fields):
+            deal = deals[time]
+            free = [sum(1 for y in range(rows) if not field[x + y * WIDTH]) for x in range(WIDTH)]
+            placements = []
+            for x in range(WIDTH):
+                for r in range(4):
+                    kumi_x = x + (r == 1) - (r == 3)
+                    if not 0 <= kumi_x < WIDTH:
+                        continue
+                    # Keep the ghost row clear so that the game can go on
+                    if (x == kumi_x and free[x] >= 3) or (x != kumi_x and free[x] >= 2 and free[kumi_x] >= 2):
+                        placements.append((x, r))
+            x, r = rng.choice(placements)
+            kumi_x = x + (r == 1) - (r == 3)
+            order = [(kumi_x, deal[1]), (x, deal[0])] if r == 2 else [(x, deal[0]), (kumi_x, deal[1])]
+            for column, puyo in order:
+                y = rows - 1
+                while field[column + y * WIDTH]:
+                    y -= 1
+                field[column + y * WIDTH] = puyo
+            events[player] = [{"type": "addPuyos", "blocks": FrameResponse(x=x, r=r).to_blocks(deal)}]
+    return states
+
+def test_minimal_interpolation():
+    full = FrameInterpolator()
+    minimal = FrameInterpolator(minimal=True)
+    for state in make_test_states():
+        full_frames = [frame for frame in full.step(state) if any(player.event for player in frame.players)]
+        minimal_frames = list(minimal.step(state))
+        # Every frame with an event, including the decision request, reaches the bot unchanged apart from its ID
+        assert [f.to_string().split(" ", 1)[1] for f in full_frames] == [f.to_string().split(" ", 1)[1] for f in minimal_frames]
+
+        for player in full.last_frame.players:
+            for x in range(WIDTH):
+                for r in range(4):
+                    if not 0 <= x + (r == 1) - (r == 3) < WIDTH:
+                        continue
+                    falling = player.copy()
+                    falling.kumipuyo_x = x
+                    falling.kumipuyo_r = r
+                    expected = falling.copy()
+                    while expected.kumi_free():
+                        expected.kumipuyo_y += 1
+                    assert falling.landing_y() == expected.kumipuyo_y - 1
+
+def benchmark_copy(number=10000):
+    payload = (
+        "ID=464 "
+        "YF=000000000000000000000000000000000000000000000000000000550000640077441044 "
+        "OF=000000000000000000000000000000000000000000000000770000770000450000650000 "
+        "YP=774676 OP=774676 YE=W------ OE=------- YX=1 YY=8 YR=0 "
+        "OX=2 OY=4 OR=3 YO=0 OO=0 YS=64 OS=110"
+    )
+    f = FrameRequest.from_string(payload)
+    assert f.copy().to_string() == f.to_string()
+    round_trip = timeit.timeit(lambda: FrameRequest.from_string(f.to_string()), number=number)
+    copy = timeit.timeit(f.copy, number=number)
+    print "round trip: {:.2f} us/copy".format(1e6 * round_trip / number)
+    print "copy:       {:.2f} us/copy".format(1e6 * copy / number)
+    print "speedup:    {:.1f}x".format(round_trip / copy)
+
+def log_entries(data):
+    if isinstance(data, basestring):
+        data = data.split("\n")
+    for payload in data:
+        if isinstance(payload, basestring):
+            payload = payload.strip()
+            if not payload:
+                continue
+        yield payload
+
+def panel_states(data, player=0):
+    for payload in log_entries(data):
+        if isinstance(payload, basestring):
+            payload = json.loads(payload)
+        if player is not None:
+            payload["player"] = player
+        yield payload
+
+def render_log(data, delay=True):
+    for payload in log_entries(data):
         f = FrameRequest.from_string(payload)
         print f.render()
+        if not delay:
+            continue
         if f.players[0].event:
             sleep(1)
         else:
             sleep(0.01)
 
-def render_panel_log(data):
-    for payload in data.split("\n"):
-        if not payload.strip():
-            continue
-        payload = json.loads(payload)
-        payload["player"] = 0
+def render_panel_log(data, delay=True, player=0):
+    for payload in panel_states(data, player):
         f = FrameRequest.from_json(payload)
         print f.render()
-        sleep(0.01)
+        if delay:
+            sleep(0.01)
 
-def interpolate_panel_log(data):
+def interpolate_panel_log(data, delay=True, player=0):
     interpolator = FrameInterpolator()
-    for payload in data.split("\n"):
-        if not payload.strip():
-            continue
-        payload = json.loads(payload)
-        payload["player"] = 0
+    for payload in panel_states(data, player):
         for frame in interpolator.step(payload):
             print frame.render()
-            sleep(0.001)
+            if delay:
+                sleep(0.001)
 
 # test_interpolation()
 
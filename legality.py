@@ -0,0 +1,121 @@
+import move_codec
+from json_api import EMPTY, WIDTH, HEIGHT, FrameResponse
+
+SPAWN_X = 2
+# Any two colors, a move is posted the same way for every deal that is not a double
+PAIR = (1, 2)
+
+def column_heights(field, width=WIDTH):
+    rows = len(field) // width
+    heights = [0] * width
+    for x in range(width):
+        for y in range(rows):
+            if field[x + y * width] != EMPTY:
+                heights[x] = rows - y
+                break
+    return heights
+
+def passable(height, from_height):
+    if height < HEIGHT:
+        return True
+    # A quick turn on a column that is almost full lifts the pair over a full column
+    return height == HEIGHT and from_height >= HEIGHT - 1
+
+def reachable_columns(heights, spawn_x=SPAWN_X):
+    width = len(heights)
+    if heights[spawn_x] >= HEIGHT:
+        return set()
+    reachable = set([spawn_x])
+    for step in (-1, 1):
+        x = spawn_x
+        while 0 <= x + step < width and passable(heights[x + step], heights[x]):
+            x += step
+            reachable.add(x)
+    return reachable
+
+def child_column(x, r):
+    if r == 1:
+        return x + 1
+    elif r == 3:
+        return x - 1
+    return x
+
+def legal_placements(field, width=WIDTH):
+    heights = column_heights(field, width)
+    rows = len(field) // width
+    reachable = reachable_columns(heights)
+    placements = []
+    for x in range(width):
+        for r in range(4):
+            child_x = child_column(x, r)
+            if x not in reachable or child_x not in reachable:
+                continue
+            if child_x == x:
+                if heights[x] + 2 > rows:
+                    continue
+            elif heights[x] + 1 > rows or heights[child_x] + 1 > rows:
+                continue
+            placements.append((x, r))
+    return placements
+
+def is_legal(field, move, width=WIDTH):
+    return (move.x, move.r) in legal_placements(field, width)
+
+def placement(move, width=WIDTH):
+    if move.x is None:
+        # A move without a column is posted as the deal in the leftmost columns by to_blocks
+        return move_codec.decode(move.to_blocks(PAIR, width), PAIR, width)
+    return move.x, move.r
+
+def nearest_legal(field, move, width=WIDTH):
+    placements = legal_placements(field, width)
+    if not placements:
+        return None
+    x, r = placement(move, width)
+    if (x, r) in placements:
+        if move.x is None:
+            return FrameResponse(move.id, x, r, move.pre_x, move.pre_r, move.message, move.mawashi_area)
+        return move
+    best_x, best_r = min(placements, key=lambda p: (abs(p[0] - x), p[1] != r, p))
+    return FrameResponse(move.id, best_x, best_r, move.pre_x, move.pre_r, move.message, move.mawashi_area)
+
+def fallback_move(field, width=WIDTH):
+    placements = legal_placements(field, width)
+    if not placements:
+        return None
+    heights = column_heights(field, width)
+
+    def cost(placement):
+        x, r = placement
+        child_x = child_column(x, r)
+        if child_x == x:
+            top = heights[x] + 2
+        else:
+            top = max(heights[x], heights[child_x]) + 1
+        # Keep the stack low and the spawn column clear
+        return (top, SPAWN_X in (x, child_x), placement)
+
+    x, r = min(placements, key=cost)
+    return FrameResponse(x=x, r=r)
+
+
+def test_legality():
+    rows = HEIGHT + 1
+    field = [EMPTY] * (WIDTH * rows)
+    assert len(legal_placements(field)) == 22
+    for y in range(1, rows):
+        field[3 + y * WIDTH] = 1
+    assert column_heights(field) == [0, 0, 0, HEIGHT, 0, 0]
+    assert reachable_columns(column_heights(field)) == set([0, 1, 2])
+    move = nearest_legal(field, FrameResponse(x=5, r=0))
+    assert (move.x, move.r) == (2, 0)
+    move = nearest_legal(field, FrameResponse(x=2, r=1))
+    assert (move.x, move.r) == (2, 0)
+    assert placement(FrameResponse()) == (0, 1)
+    move = nearest_legal(field, FrameResponse())
+    assert (move.x, move.r) == (0, 1)
+    move = fallback_move(field)
+    assert (move.x, move.r) == (0, 1)
+    for y in range(2, rows):
+        field[2 + y * WIDTH] = 1
+    assert reachable_columns(column_heights(field)) == set([0, 1, 2, 3, 4, 5])
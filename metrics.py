@@ -0,0 +1,117 @@
+import os
+import threading
+import BaseHTTPServer
+from collections import deque
+from time import sleep
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Summary(object):
+    def __init__(self, size=1024):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, quantiles=QUANTILES):
+        samples = sorted(self.samples)
+        if not samples:
+            return [(q, float("nan")) for q in quantiles]
+        return [(q, samples[min(len(samples) - 1, int(q * len(samples)))]) for q in quantiles]
+
+def format_labels(labels, **extra):
+    items = sorted(labels) + sorted(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, value) for key, value in items) + "}"
+
+class Metrics(object):
+    def __init__(self, window=1024):
+        self.window = window
+        self.lock = threading.Lock()
+        self.summaries = {}
+        self.counters = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                summary = self.summaries[key] = Summary(self.window)
+            summary.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self):
+        lines = []
+        with self.lock:
+            summaries = sorted(self.summaries.items())
+            counters = sorted(self.counters.items())
+            names = set()
+            for (name, labels), summary in summaries:
+                if name not in names:
+                    names.add(name)
+                    lines.append("# TYPE {} summary".format(name))
+                for q, value in summary.quantiles():
+                    lines.append("{}{} {}".format(name, format_labels(labels, quantile=q), value))
+                lines.append("{}_sum{} {}".format(name, format_labels(labels), summary.total))
+                lines.append("{}_count{} {}".format(name, format_labels(labels), summary.count))
+            for (name, labels), value in counters:
+                if name not in names:
+                    names.add(name)
+                    lines.append("# TYPE {} counter".format(name))
+                lines.append("{}{} {}".format(name, format_labels(labels), value))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        # Write to a temporary file first so that scrapers never see half a dump
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(self.render())
+        os.rename(temporary, path)
+
+    def dump_periodically(self, path, interval=10.0):
+        def run():
+            while True:
+                sleep(interval)
+                self.dump(path)
+        thread = threading.Thread(target=run, name="metrics-dump")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def serve(self, port, host="127.0.0.1"):
+        metrics = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, name="metrics-server")
+        thread.daemon = True
+        thread.start()
+        return server
+
+metrics = Metrics()
+
+def configure(port=None, path=None, interval=10.0):
+    if port:
+        metrics.serve(port)
+    if path:
+        metrics.dump_periodically(path, interval)
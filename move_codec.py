@@ -0,0 +1,67 @@
+EMPTY = 0
+ROW_FORMATS = (1, 2, 3)
+
+class UnresolvableBlocks(ValueError):
+    pass
+
+_indexes = {}
+
+def child_offset(r, width):
+    if r == 0:
+        return -width
+    elif r == 1:
+        return 1
+    elif r == 2:
+        return width
+    else:
+        return -1
+
+def encode(x, r, deal, width):
+    blocks = [EMPTY] * (width * 3)
+    blocks[x + width] = deal[0]
+    blocks[x + width + child_offset(r, width)] = deal[1]
+    return blocks
+
+def trim(blocks, r, rows, width):
+    if rows == 2:
+        if r == 0:
+            return blocks[:-width]
+        return blocks[width:]
+    elif rows == 1:
+        return blocks[width:-width]
+    return blocks
+
+def build_index(width):
+    index = {}
+    for same in (False, True):
+        deal = (1, 1) if same else (1, 2)
+        for x in range(width):
+            for r in range(4):
+                child_x = x + (r == 1) - (r == 3)
+                if not 0 <= child_x < width:
+                    continue
+                blocks = encode(x, r, deal, width)
+                for rows in ROW_FORMATS:
+                    trimmed = trim(blocks, r, rows, width)
+                    if sum(1 for puyo in trimmed if puyo != EMPTY) != 2:
+                        continue
+                    # Equivalent placements of a double resolve to the first one found
+                    index.setdefault((rows, same, tuple(trimmed)), (x, r))
+    return index
+
+def get_index(width):
+    index = _indexes.get(width)
+    if index is None:
+        index = _indexes[width] = build_index(width)
+    return index
+
+def decode(blocks, deal, width):
+    if not blocks or len(blocks) % width:
+        raise UnresolvableBlocks("Cannot resolve blocks {} of width {}".format(blocks, width))
+    same = (deal[0] == deal[1])
+    colors = {EMPTY: 0, deal[0]: 1, deal[1]: 1 if same else 2}
+    try:
+        key = (len(blocks) // width, same, tuple(colors[puyo] for puyo in blocks))
+        return get_index(width)[key]
+    except KeyError:
+        raise UnresolvableBlocks("Cannot resolve blocks {} for deal {}".format(blocks, list(deal)))
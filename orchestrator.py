@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+import argparse
+import threading
+import traceback
+from time import sleep
+import os.path
+from bridgelog import log
+from metrics import metrics as stats
+from api import PanelClient
+from bot_pool import BotPool
+from connect import run_game, make_driver, make_cache, add_bridge_arguments, configure
+from dashboard import Feed
+from replay import ReplayWriter
+
+class Slot(threading.Thread):
+    def __init__(self, command, url, options, index, pool=None, replay=None, cache=None, feed=None):
+        super(Slot, self).__init__(name='{}#{}'.format(command, index))
+        self.daemon = True
+        self.command = command
+        self.client = PanelClient(url)
+        self.options = options
+        self.pool = pool
+        self.replay = replay
+        self.cache = cache
+        self.feed = feed
+        self.games = 0
+        self.errors = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        restart = False
+        while not self.stopped.is_set():
+            if restart:
+                stats.inc('bridge_restarts_total', bot=os.path.basename(self.command))
+                sleep(1)
+            try:
+                run_game(self.command, self.client, self.options, self.pool, self.replay, self.cache, self.feed)
+                self.games += 1
+            except Exception:
+                self.errors += 1
+                log.error('slot_failed', traceback=traceback.format_exc())
+            restart = True
+
+    def stop(self):
+        self.stopped.set()
+
+class Orchestrator(object):
+    def __init__(self, url, options):
+        self.url = url
+        self.options = options
+        self.replay = ReplayWriter(options.replay) if options.replay else None
+        # One socket publishes the frames of all slots
+        self.feed = Feed(options.feed) if options.feed else None
+        # Builds can disagree so every bot gets a cache of its own
+        self.caches = {}
+        self.slots = []
+        self.pools = []
+
+    def add_bot(self, command, num_slots):
+        cache = self.caches[command] = make_cache(self.options)
+        pool = None
+        if self.options.warm:
+            pool = BotPool(self.options.warm, self.make_driver)
+            self.pools.append((command, pool))
+        for i in range(num_slots):
+            self.slots.append(Slot(command, self.url, self.options, i, pool, self.replay, cache, self.feed))
+
+    def make_driver(self, executable):
+        return make_driver(executable, self.options, self.caches.get(executable))
+
+    def start(self):
+        for command, pool in self.pools:
+            pool.warm(command)
+        for slot in self.slots:
+            slot.start()
+
+    def stop(self):
+        for slot in self.slots:
+            slot.stop()
+        for command, pool in self.pools:
+            pool.close()
+
+    def run(self):
+        self.start()
+        try:
+            # Join with a timeout so that KeyboardInterrupt reaches the main thread
+            while any(slot.is_alive() for slot in self.slots):
+                for slot in self.slots:
+                    slot.join(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+def parse_bot(spec, default_slots):
+    command, sep, num_slots = spec.rpartition(':')
+    # The last number of tcp:host:port is the port, not a slot count
+    if sep and num_slots.isdigit() and command not in ('tcp', 'unix') and not (command.startswith('tcp:') and command.count(':') == 1):
+        return command, int(num_slots)
+    return spec, default_slots
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run many games concurrently from a single bridge process')
+    parser.add_argument('url', metavar='url', type=str, help='API URL')
+    parser.add_argument('bots', metavar='command[:slots]', type=str, nargs='+', help='Executable for the puyoai bot or the unix:/tcp: endpoint of a botd, and the number of games to run with it')
+    parser.add_argument('--slots', type=int, default=1, help='Number of games per bot when not given explicitly')
+    add_bridge_arguments(parser)
+
+    args = parser.parse_args()
+    configure(args)
+    orchestrator = Orchestrator(args.url, args)
+    for spec in args.bots:
+        orchestrator.add_bot(*parse_bot(spec, args.slots))
+    orchestrator.run()
@@ -0,0 +1,79 @@
+import random
+from time import sleep, time
+
+def state_key(state):
+    return (state.get('time'), state.get('canPlay'), state.get('status', {}).get('terminated'))
+
+class Poller(object):
+    def __init__(self, fetch, key=state_key, min_delay=0.02, max_delay=0.2, jitter=0.2, hold_threshold=0.15, smoothing=0.1):
+        self.fetch = fetch
+        self.key = key
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.hold_threshold = hold_threshold
+        self.smoothing = smoothing
+        self.delay = 0
+        self.long_poll = False
+        self.last_key = None
+        self.min_rtt = None
+        self.latency = None
+        self.polls = 0
+        self.changes = 0
+        self.waited = 0.0
+
+    def reset(self):
+        # Something happened on our side so the state is likely to change soon
+        self.delay = 0
+
+    def poll(self):
+        wait = 0
+        if self.delay and not self.long_poll:
+            wait = self.delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            sleep(wait)
+        start = time()
+        state = self.fetch()
+        duration = time() - start
+        self.polls += 1
+        self.waited += wait
+
+        key = self.key(state)
+        changed = (key != self.last_key)
+        self.last_key = key
+        # A hold is measured against the fastest round trip so that a distant server does not look like a long poll
+        held = self.min_rtt is not None and duration > self.min_rtt + self.hold_threshold
+        if not held and (self.min_rtt is None or duration < self.min_rtt):
+            self.min_rtt = duration
+
+        if held:
+            # The server sat on the request until something happened so poll again right away
+            self.long_poll = True
+            self.delay = 0
+        elif changed:
+            self.delay = self.min_delay
+        else:
+            self.long_poll = False
+            self.delay = min(max(self.delay * 2, self.min_delay), self.max_delay)
+
+        if changed:
+            self.changes += 1
+            if held:
+                sample = self.min_rtt or duration
+            else:
+                # A change is equally likely to have happened at any point since the previous response
+                sample = (wait + duration) / 2.0
+            if self.latency is None:
+                self.latency = sample
+            else:
+                self.latency += self.smoothing * (sample - self.latency)
+        return state
+
+    def stats(self):
+        return {
+            'polls': self.polls,
+            'changes': self.changes,
+            'waited': self.waited,
+            'long_poll': self.long_poll,
+            'delay': self.delay,
+            'latency': self.latency,
+        }
@@ -0,0 +1,218 @@
+import os
+import signal
+import socket
+import sys
+import threading
+from collections import defaultdict
+from itertools import count
+from time import sleep, time, strftime, localtime
+from bridgelog import log
+
+IDLE = "[idle]"
+# Leaf frames of threads that are blocked rather than using the CPU
+IDLE_LEAVES = set([
+    "threading.py:wait",
+    "socket.py:readinto",
+    "socket.py:recv",
+    "socket.py:accept",
+    "SocketServer.py:_eintr_retry",
+    "transport.py:read_into",
+])
+
+games = {}
+# Profiles stopped within the same millisecond still get files of their own
+profile_numbers = count(1)
+
+def set_game(uuid):
+    games[threading.current_thread().ident] = uuid
+
+def clear_game():
+    games.pop(threading.current_thread().ident, None)
+
+class SamplingProfiler(object):
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self.names = {}
+        self.samples = 0
+        self.started = None
+        self.stopped = None
+        self.running = threading.Event()
+        self.thread = None
+
+    def frame_name(self, code):
+        name = self.names.get(code)
+        if name is None:
+            name = self.names[code] = "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+        return name
+
+    def start(self):
+        self.stacks.clear()
+        self.samples = 0
+        self.started = time()
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, name="profiler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        self.thread.join()
+        self.stopped = time()
+
+    def run(self):
+        me = threading.current_thread().ident
+        positions = {}
+        while self.running.is_set():
+            threads = dict((thread.ident, thread.name) for thread in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                # A thread whose leaf frame has not moved since the last sample is blocked in a call
+                position = (id(frame), frame.f_lasti)
+                idle = positions.get(ident) == position
+                positions[ident] = position
+                stack = []
+                while frame is not None:
+                    stack.append(self.frame_name(frame.f_code))
+                    frame = frame.f_back
+                game = games.get(ident)
+                stack.append("game:" + game if game else "thread:" + threads.get(ident, str(ident)))
+                stack.reverse()
+                if idle or stack[-1] in IDLE_LEAVES:
+                    stack.append(IDLE)
+                self.stacks[tuple(stack)] += 1
+            self.samples += 1
+            sleep(self.interval)
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write("{} {}\n".format(";".join(stack), count))
+
+    def summary(self, top=20):
+        totals = defaultdict(int)
+        selfs = defaultdict(lambda: defaultdict(int))
+        inclusive = defaultdict(lambda: defaultdict(int))
+        for stack, count in self.stacks.items():
+            if stack[-1] == IDLE:
+                continue
+            tag = stack[0]
+            totals[tag] += count
+            selfs[tag][stack[-1]] += count
+            for name in set(stack[1:]):
+                inclusive[tag][name] += count
+        lines = ["{} samples every {:.1f}ms over {:.1f}s, idle samples left out".format(
+            self.samples, self.interval * 1000, (self.stopped or time()) - self.started)]
+        for tag in sorted(totals, key=totals.get, reverse=True):
+            total = totals[tag]
+            lines.append("")
+            lines.append("{} ({} busy samples)".format(tag, total))
+            lines.append("{:>7} {:>7}  function".format("self", "total"))
+            hot = sorted(inclusive[tag], key=lambda name: (selfs[tag].get(name, 0), inclusive[tag][name]), reverse=True)
+            for name in hot[:top]:
+                lines.append("{:6.1f}% {:6.1f}%  {}".format(
+                    100.0 * selfs[tag].get(name, 0) / total, 100.0 * inclusive[tag][name] / total, name))
+        return "\n".join(lines) + "\n"
+
+class ProfileControl(object):
+    def __init__(self, directory=".", interval=0.005, top=20):
+        self.directory = directory
+        self.interval = interval
+        self.top = top
+        self.lock = threading.Lock()
+        self.profiler = None
+
+    def start(self, interval=None):
+        with self.lock:
+            if self.profiler is not None:
+                return "already running"
+            self.profiler = SamplingProfiler(interval or self.interval)
+            self.profiler.start()
+        log.info("profile_started", interval=self.profiler.interval)
+        return "started"
+
+    def stop(self):
+        with self.lock:
+            profiler = self.profiler
+            self.profiler = None
+        if profiler is None:
+            return "not running"
+        profiler.stop()
+        now = time()
+        name = "profile-{}-{}.{:03d}-{}".format(
+            os.getpid(), strftime("%Y%m%d-%H%M%S", localtime(now)), int(now * 1000) % 1000, next(profile_numbers))
+        prefix = os.path.join(self.directory, name)
+        profiler.write_collapsed(prefix + ".collapsed")
+        with open(prefix + ".txt", "w") as f:
+            f.write(profiler.summary(self.top))
+        log.info("profile_written", path=prefix, samples=profiler.samples)
+        return "written {0}.collapsed {0}.txt".format(prefix)
+
+    def toggle(self):
+        if self.profiler is None:
+            return self.start()
+        return self.stop()
+
+    def handle_signal(self, signum, frame):
+        # Writing the profile can take a while so keep it off the interrupted thread
+        thread = threading.Thread(target=self.toggle, name="profile-toggle")
+        thread.daemon = True
+        thread.start()
+
+    def command(self, words):
+        command = words[0] if words else "status"
+        if command == "start":
+            try:
+                interval = float(words[1]) / 1000 if len(words) > 1 else None
+            except ValueError:
+                interval = 0
+            if interval is not None and interval <= 0:
+                return "bad interval {}, give it in milliseconds".format(words[1])
+            return self.start(interval)
+        elif command == "stop":
+            return self.stop()
+        elif command == "status":
+            return "running" if self.profiler is not None else "stopped"
+        return "unknown command {}, use start [interval_ms], stop or status".format(command)
+
+    def handle(self, connection):
+        try:
+            words = connection.makefile().readline().split()
+            try:
+                reply = self.command(words)
+            except (ValueError, IOError) as e:
+                reply = "failed: {}".format(e)
+            connection.sendall(reply + "\n")
+        except socket.error as e:
+            # A client that went away must not take the control socket down with it
+            log.warning("profile_control_failed", error=e)
+        finally:
+            connection.close()
+
+    def serve(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(4)
+
+        def run():
+            while True:
+                connection, _ = server.accept()
+                self.handle(connection)
+
+        thread = threading.Thread(target=run, name="profile-control")
+        thread.daemon = True
+        thread.start()
+        return server
+
+def configure(directory=".", socket_path=None, signum=signal.SIGUSR2):
+    control = ProfileControl(directory)
+    if signum:
+        signal.signal(signum, control.handle_signal)
+        # Restart interrupted system calls so the signal does not break a blocking poll or bot read
+        signal.siginterrupt(signum, False)
+    if socket_path:
+        control.serve(socket_path)
+    return control
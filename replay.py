@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+import argparse
+import mmap
+import os
+import struct
+import threading
+from json_api import FrameInterpolator, render_log, interpolate_panel_log
+from state_view import loads
+
+INDEX = struct.Struct("<IIQ")
+GAME_HEADER = 0xFFFFFFFF
+GAME_END = 0xFFFFFFFE
+
+class ReplayWriter(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.num_games = 0
+        # First turn offsets are only tracked for the games still being written
+        self.turns = {}
+        if os.path.exists(path + ".idx"):
+            for game, turn, offset in read_index(path + ".idx"):
+                self.num_games = max(self.num_games, game + 1)
+        self.log = open(path, "ab")
+        self.log.seek(0, os.SEEK_END)
+        self.index = open(path + ".idx", "ab")
+
+    def append(self, kind, game, turn, payload):
+        line = "{} {} {} {}\n".format(kind, game, turn, payload)
+        with self.lock:
+            offset = self.log.tell()
+            turns = self.turns.get(game)
+            if turns is None or turn not in turns:
+                if turns is not None:
+                    turns.add(turn)
+                self.index.write(INDEX.pack(game, turn, offset))
+            self.log.write(line)
+
+    def start_game(self, uuid):
+        with self.lock:
+            game = self.num_games
+            self.num_games += 1
+            self.turns[game] = set()
+        self.append("G", game, GAME_HEADER, uuid)
+        return game
+
+    def end_game(self, game):
+        self.append("E", game, GAME_END, "")
+        with self.lock:
+            self.turns.pop(game, None)
+
+    def write_state(self, game, turn, payload):
+        # Whitespace is all a raw newline can be in JSON
+        self.append("S", game, turn, payload.replace("\n", " "))
+
+    def write_frame(self, game, turn, frame):
+        self.append("F", game, turn, frame.to_string())
+
+    def flush(self):
+        with self.lock:
+            self.log.flush()
+            self.index.flush()
+
+    def close(self):
+        self.flush()
+        self.log.close()
+        self.index.close()
+
+class GameRecorder(object):
+    def __init__(self, writer, uuid):
+        self.writer = writer
+        self.game = writer.start_game(uuid)
+        self.turn = 0
+
+    def state(self, state, payload):
+        self.turn = state.time
+        self.writer.write_state(self.game, state.time, payload)
+
+    def __call__(self, frame):
+        self.writer.write_frame(self.game, self.turn, frame)
+
+    def close(self):
+        self.writer.end_game(self.game)
+
+def read_index(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    for i in range(len(data) // INDEX.size):
+        yield INDEX.unpack_from(data, i * INDEX.size)
+
+class ReplayReader(object):
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else ""
+        self.offsets = {}
+        self.ends = {}
+        self.uuids = []
+        for game, turn, offset in read_index(path + ".idx"):
+            if (game, turn) in self.offsets:
+                continue
+            self.offsets[game, turn] = offset
+            if turn == GAME_END:
+                self.ends[game] = offset
+            elif turn == GAME_HEADER:
+                self.uuids.append(self.parse(self.read_line(offset))[3])
+
+    def read_line(self, offset):
+        end = self.data.find("\n", offset)
+        if end < 0:
+            end = len(self.data)
+        return self.data[offset:end]
+
+    def parse(self, line):
+        kind, game, turn, payload = line.split(" ", 3)
+        return kind, int(game), int(turn), payload
+
+    def game_number(self, game):
+        if isinstance(game, int):
+            return game
+        return self.uuids.index(game)
+
+    def seek(self, game, turn=None):
+        game = self.game_number(game)
+        if turn is None:
+            return self.offsets[game, GAME_HEADER]
+        return self.offsets[game, turn]
+
+    def records(self, game=None, turn=None):
+        offset = 0
+        end = len(self.data)
+        if game is not None:
+            game = self.game_number(game)
+            offset = self.seek(game, turn)
+            # Games that were not ended, like those of a bridge that crashed, run to the end of the log
+            end = self.ends.get(game, end)
+        while offset < end:
+            line = self.read_line(offset)
+            offset += len(line) + 1
+            record = self.parse(line)
+            # Games played concurrently are interleaved in the log
+            if game is None or record[1] == game:
+                yield record
+
+    def states(self, game=None, turn=None):
+        for kind, game, turn, payload in self.records(game, turn):
+            if kind == "S":
+                yield loads(payload)
+
+    def frames(self, game=None, turn=None):
+        for kind, game, turn, payload in self.records(game, turn):
+            if kind == "F":
+                yield payload
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self.file.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a bridge log')
+    parser.add_argument('path', metavar='path', type=str, help='Replay log written with --replay')
+    parser.add_argument('--game', type=str, help='Game uuid or number to replay')
+    parser.add_argument('--turn', type=int, help='Turn to start from')
+    parser.add_argument('--states', action='store_true', help='Re-interpolate the panel states instead of replaying the recorded frames')
+    parser.add_argument('--batch', action='store_true', help='Print wire frames without rendering or sleeping')
+
+    args = parser.parse_args()
+    reader = ReplayReader(args.path)
+    game = args.game
+    if game is not None and game.isdigit():
+        game = int(game)
+    if args.states:
+        states = reader.states(game, args.turn)
+        if args.batch:
+            interpolator = FrameInterpolator()
+            for state in states:
+                for frame in interpolator.step(state):
+                    print (frame.to_string())
+        else:
+            interpolate_panel_log(states, player=None)
+    elif args.batch:
+        for payload in reader.frames(game, args.turn):
+            print (payload)
+    else:
+        render_log(reader.frames(game, args.turn))
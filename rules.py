@@ -0,0 +1,279 @@
+import random
+import move_codec
+from json_api import EMPTY, OJAMA, WIDTH, HEIGHT, GHOST_HEIGHT, FrameResponse
+from legality import SPAWN_X, is_legal
+
+COLOR_BONUSES = (0, 0, 3, 6, 12, 24)
+GROUP_BONUSES = (0, 0, 0, 0, 0, 2, 3, 4, 5, 6, 7, 10)
+MAX_OJAMA_DROP = 30
+
+class IllegalMove(ValueError):
+    pass
+
+_neighbours = {}
+
+def build_neighbours(width, rows, ghost_height):
+    # Puyos in the ghost row never connect so they are left out
+    neighbours = []
+    for i in range(width * rows):
+        x, y = i % width, i // width
+        cells = []
+        if y < ghost_height:
+            neighbours.append(())
+            continue
+        if x > 0:
+            cells.append(i - 1)
+        if x < width - 1:
+            cells.append(i + 1)
+        if y > ghost_height:
+            cells.append(i - width)
+        if y < rows - 1:
+            cells.append(i + width)
+        neighbours.append(tuple(cells))
+    return neighbours
+
+def get_neighbours(width, rows, ghost_height):
+    key = (width, rows, ghost_height)
+    neighbours = _neighbours.get(key)
+    if neighbours is None:
+        neighbours = _neighbours[key] = build_neighbours(width, rows, ghost_height)
+    return neighbours
+
+def chain_power(chain):
+    if chain <= 3:
+        return (0, 0, 8, 16)[chain]
+    return 32 * (chain - 3)
+
+def chain_score(chain, groups):
+    cleared = sum(len(group) for color, group in groups)
+    colors = len(set(color for color, group in groups))
+    bonus = chain_power(chain) + COLOR_BONUSES[colors]
+    bonus += sum(GROUP_BONUSES[min(len(group), len(GROUP_BONUSES) - 1)] for color, group in groups)
+    return 10 * cleared * min(999, max(1, bonus))
+
+class Board(object):
+    def __init__(self, width=WIDTH, height=HEIGHT, ghost_height=GHOST_HEIGHT, clear_threshold=4):
+        self.width = width
+        self.height = height
+        self.ghost_height = ghost_height
+        self.rows = height + ghost_height
+        self.clear_threshold = clear_threshold
+        self.blocks = [EMPTY] * (width * self.rows)
+        self.heights = [0] * width
+        self.neighbours = get_neighbours(width, self.rows, ghost_height)
+
+    def drop(self, x, puyo, effects):
+        height = self.heights[x]
+        if height >= self.rows:
+            # Puyos above the ghost row vanish
+            return None
+        index = x + (self.rows - 1 - height) * self.width
+        self.blocks[index] = puyo
+        self.heights[x] = height + 1
+        effects.append({"type": "puyoDropped", "color": puyo, "from": index - len(self.blocks), "to": index})
+        return index
+
+    def place(self, x, r, deal, effects):
+        child_x = x + (r == 1) - (r == 3)
+        if r == 2:
+            self.drop(child_x, deal[1], effects)
+            self.drop(x, deal[0], effects)
+        else:
+            self.drop(x, deal[0], effects)
+            self.drop(child_x, deal[1], effects)
+
+    def groups(self):
+        blocks = self.blocks
+        neighbours = self.neighbours
+        seen = bytearray(len(blocks))
+        groups = []
+        for i in range(self.ghost_height * self.width, len(blocks)):
+            color = blocks[i]
+            if color <= EMPTY or seen[i]:
+                continue
+            seen[i] = 1
+            group = [i]
+            stack = [i]
+            while stack:
+                for j in neighbours[stack.pop()]:
+                    if not seen[j] and blocks[j] == color:
+                        seen[j] = 1
+                        group.append(j)
+                        stack.append(j)
+            if len(group) >= self.clear_threshold:
+                groups.append((color, group))
+        return groups
+
+    def clear(self, groups, effects):
+        blocks = self.blocks
+        for color, group in groups:
+            for i in group:
+                blocks[i] = EMPTY
+            effects.append({"type": "groupCleared", "color": color, "blocks": group})
+        ojamas = set(j for color, group in groups for i in group for j in self.neighbours[i] if blocks[j] == OJAMA)
+        for i in ojamas:
+            blocks[i] = EMPTY
+        if ojamas:
+            effects.append({"type": "groupCleared", "color": OJAMA, "blocks": sorted(ojamas)})
+
+    def settle(self, effects):
+        blocks = self.blocks
+        width = self.width
+        bottom = (self.rows - 1) * width
+        for x in range(width):
+            write = x + bottom
+            for read in range(write, x - 1, -width):
+                puyo = blocks[read]
+                if puyo == EMPTY:
+                    continue
+                if read != write:
+                    blocks[write] = puyo
+                    blocks[read] = EMPTY
+                    effects.append({"type": "puyoDropped", "color": puyo, "from": read, "to": write})
+                write -= width
+            self.heights[x] = (x + bottom - write) // width
+
+    def resolve(self, effects):
+        chain = 0
+        score = 0
+        while True:
+            groups = self.groups()
+            if not groups:
+                return chain, score
+            chain += 1
+            score += chain_score(chain, groups)
+            self.clear(groups, effects)
+            self.settle(effects)
+
+    def drop_ojama(self, count, rng, effects):
+        columns = [count // self.width] * self.width
+        for x in rng.sample(range(self.width), count % self.width):
+            columns[x] += 1
+        # Drop row by row so that the effects come out in the order the ojama land
+        for row in range(max(columns)):
+            for x in range(self.width):
+                if columns[x] > row:
+                    self.drop(x, OJAMA, effects)
+
+    def game_over(self):
+        return self.blocks[SPAWN_X + self.ghost_height * self.width] != EMPTY
+
+class Duel(object):
+    def __init__(self, seed=None, num_colors=4, num_deals=3, width=WIDTH, height=HEIGHT, target_score=70, clear_threshold=4):
+        self.rng = random.Random(seed)
+        self.num_colors = num_colors
+        self.num_deals = num_deals
+        self.width = width
+        self.height = height
+        self.target_score = target_score
+        self.clear_threshold = clear_threshold
+        self.boards = [Board(width, height, GHOST_HEIGHT, clear_threshold) for _ in range(2)]
+        self.deals = []
+        self.time = 0
+        self.moves = [None, None]
+        self.events = [[], []]
+        self.effects = [[], []]
+        self.scores = [0, 0]
+        self.chain_scores = [0, 0]
+        self.chain_numbers = [0, 0]
+        self.leftovers = [0, 0]
+        self.pending = [0, 0]
+        self.terminated = False
+        self.winner = None
+        self.reason = None
+
+    def visible_deals(self):
+        while len(self.deals) < self.time + self.num_deals:
+            self.deals.append([self.rng.randint(1, self.num_colors), self.rng.randint(1, self.num_colors)])
+        return self.deals
+
+    def deal(self):
+        return self.visible_deals()[self.time]
+
+    def can_play(self, player):
+        return not self.terminated and self.moves[player] is None
+
+    def play(self, player, blocks):
+        if self.terminated:
+            raise IllegalMove("the game is over")
+        if self.moves[player] is not None:
+            raise IllegalMove("already played turn {}".format(self.time))
+        deal = self.deal()
+        try:
+            x, r = move_codec.decode(blocks, deal, self.width)
+        except move_codec.UnresolvableBlocks as e:
+            raise IllegalMove(str(e))
+        if not is_legal(self.boards[player].blocks, FrameResponse(x=x, r=r), self.width):
+            raise IllegalMove("cannot reach x={} r={}".format(x, r))
+        self.moves[player] = (x, r, blocks)
+        if all(move is not None for move in self.moves):
+            self.resolve()
+            return True
+        return False
+
+    def resolve(self):
+        deal = self.deal()
+        sent = [0, 0]
+        for player, board in enumerate(self.boards):
+            x, r, blocks = self.moves[player]
+            effects = self.effects[player] = []
+            self.events[player] = [{"type": "addPuyos", "blocks": blocks}]
+            board.place(x, r, deal, effects)
+            chain, score = board.resolve(effects)
+            self.chain_numbers[player] = chain
+            self.chain_scores[player] = score
+            self.scores[player] += score
+            nuisance, self.leftovers[player] = divmod(score + self.leftovers[player], self.target_score)
+            # Nuisance cancels our own pending nuisance before it is sent
+            offset = min(nuisance, self.pending[player])
+            self.pending[player] -= offset
+            sent[player] = nuisance - offset
+        for player, board in enumerate(self.boards):
+            self.pending[1 - player] += sent[player]
+        for player, board in enumerate(self.boards):
+            # Nuisance waits for the chain to end
+            if self.pending[player] and not self.chain_numbers[player]:
+                count = min(self.pending[player], MAX_OJAMA_DROP)
+                self.pending[player] -= count
+                board.drop_ojama(count, self.rng, self.effects[player])
+        for player in range(2):
+            for effect in self.effects[player]:
+                effect["player"] = player
+                effect["time"] = self.time
+        self.time += 1
+        self.moves = [None, None]
+        losers = [player for player, board in enumerate(self.boards) if board.game_over()]
+        if losers:
+            self.finish(None if len(losers) == 2 else 1 - losers[0], "gameOver")
+
+    def finish(self, winner, reason):
+        self.terminated = True
+        self.winner = winner
+        self.reason = reason
+
+
+def test_rules():
+    board = Board()
+    effects = []
+    for x in range(4):
+        board.drop(x, 1, effects)
+    board.drop(4, OJAMA, effects)
+    assert board.resolve(effects) == (1, 40)
+    assert board.blocks == [EMPTY] * len(board.blocks)
+    # Two link chain: a vertical pair of 2 on top of three 1s, cleared by a fourth 1
+    board = Board()
+    for puyo in (2, 2, 2):
+        board.drop(0, puyo, effects)
+    board.drop(1, 1, effects)
+    board.drop(1, 1, effects)
+    board.drop(1, 1, effects)
+    board.drop(1, 2, effects)
+    board.drop(2, 1, effects)
+    assert board.resolve(effects) == (2, 40 + 40 * 8)
+    assert board.heights == [0] * WIDTH
+    duel = Duel(seed=1)
+    while not duel.terminated:
+        for player in range(2):
+            duel.play(player, move_codec.encode(SPAWN_X, 0, duel.deal(), WIDTH))
+    # Both players got the same deals and made the same moves
+    assert duel.winner is None and duel.reason == "gameOver"
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+import argparse
+import json
+import random
+import threading
+import urlparse
+import uuid
+from time import time
+import BaseHTTPServer
+import SocketServer
+from Cookie import SimpleCookie
+import bridgelog
+from bridgelog import log
+from json_api import GHOST_HEIGHT
+from legality import legal_placements
+from rules import Duel, IllegalMove
+import move_codec
+
+POLL_TIMEOUT = 20.0
+SESSION_COOKIE = 'session'
+HOUSE = 'house'
+
+class Room(object):
+    def __init__(self, id, mode, metadata, seed=None, time_limit=None):
+        self.id = id
+        self.mode = mode
+        self.metadata = metadata
+        self.time_limit = time_limit
+        self.duel = Duel(seed)
+        self.turn = None
+        self.turn_started = time()
+        self.house_rng = random.Random(seed)
+        self.sessions = []
+        self.condition = threading.Condition()
+        self.version = 0
+        self.cache = {}
+
+    def status(self):
+        if self.duel.terminated:
+            return 'terminated'
+        if len(self.sessions) < 2:
+            return 'open'
+        return 'running'
+
+    def seat(self, session):
+        if session in self.sessions:
+            return self.sessions.index(session)
+        return None
+
+    def join(self, session):
+        with self.condition:
+            if session not in self.sessions:
+                if len(self.sessions) >= 2:
+                    raise IllegalMove('the game is full')
+                self.sessions.append(session)
+            self.house_move()
+            self.changed()
+            return self.sessions.index(session)
+
+    def changed(self):
+        self.version += 1
+        self.cache.clear()
+        turn = (len(self.sessions), self.duel.time)
+        if turn != self.turn:
+            self.turn = turn
+            self.turn_started = time()
+        self.condition.notify_all()
+
+    def remaining(self):
+        return self.turn_started + self.time_limit - time()
+
+    def check_timeout(self):
+        if not self.time_limit or self.duel.terminated or len(self.sessions) < 2 or self.remaining() > 0:
+            return
+        late = [player for player in range(2) if self.duel.can_play(player)]
+        self.duel.finish(None if len(late) != 1 else 1 - late[0], 'timeout')
+        self.changed()
+
+    def can_play(self, player):
+        return player is not None and len(self.sessions) == 2 and self.duel.can_play(player)
+
+    def render(self, player):
+        body = self.cache.get(player)
+        if body is None:
+            body = self.cache[player] = json.dumps(game_state(self, player), separators=(',', ':'))
+        return body
+
+    def poll(self, player, wait=False):
+        with self.condition:
+            self.check_timeout()
+            if wait and not (self.can_play(player) or self.duel.terminated):
+                # Hold the request until something happens in the game or the turn runs out
+                timeout = POLL_TIMEOUT
+                if self.time_limit and len(self.sessions) == 2:
+                    timeout = min(timeout, max(self.remaining(), 0) + 0.01)
+                self.condition.wait(timeout)
+                self.check_timeout()
+            return self.render(player)
+
+    def play(self, player, blocks):
+        with self.condition:
+            if len(self.sessions) < 2:
+                raise IllegalMove('waiting for an opponent')
+            self.check_timeout()
+            self.duel.play(player, blocks)
+            self.house_move()
+            self.changed()
+
+    def house_move(self):
+        # The built-in opponent drops its pair at a random legal position
+        if HOUSE not in self.sessions or len(self.sessions) < 2:
+            return
+        player = self.sessions.index(HOUSE)
+        if not self.duel.can_play(player):
+            return
+        board = self.duel.boards[player]
+        placements = legal_placements(board.blocks, board.width)
+        x, r = self.house_rng.choice(placements)
+        self.duel.play(player, move_codec.encode(x, r, self.duel.deal(), board.width))
+
+    def leave(self, player):
+        with self.condition:
+            if player is not None and not self.duel.terminated:
+                if len(self.sessions) < 2:
+                    self.duel.finish(None, 'cancelled')
+                else:
+                    self.duel.finish(1 - player, 'forfeit')
+                self.changed()
+
+def child_state(duel, player):
+    board = duel.boards[player]
+    return {
+        'time': duel.time,
+        'player': player,
+        'dealIndex': duel.time,
+        'totalScore': duel.scores[player],
+        'chainScore': duel.chain_scores[player],
+        'chainNumber': duel.chain_numbers[player],
+        'leftoverScore': duel.leftovers[player],
+        'pendingNuisance': duel.pending[player],
+        'incomingNuisance': duel.pending[player],
+        'gameOvers': int(duel.terminated and duel.winner != player),
+        'width': board.width,
+        'height': board.height,
+        'ghostHeight': GHOST_HEIGHT,
+        'targetScore': duel.target_score,
+        'clearThreshold': duel.clear_threshold,
+        'blocks': board.blocks,
+        'events': duel.events[player],
+        'effects': duel.effects[player],
+    }
+
+def game_result(duel, player):
+    if duel.winner is None:
+        return 'draw'
+    return 'win' if duel.winner == player else 'loss'
+
+def game_state(room, player):
+    duel = room.duel
+    status = {'terminated': duel.terminated}
+    if duel.terminated:
+        status['result'] = game_result(duel, player)
+        status['reason'] = duel.reason
+    return {
+        'time': duel.time,
+        'numColors': duel.num_colors,
+        'numPlayers': 2,
+        'numDeals': duel.num_deals,
+        'maxLosses': 1,
+        'width': duel.width,
+        'height': duel.height,
+        'childStates': [child_state(duel, i) for i in range(2)],
+        'deals': duel.visible_deals(),
+        'status': status,
+        'timeLimit': room.time_limit,
+        'canPlay': room.can_play(player),
+        'player': player if player is not None else 0,
+    }
+
+class Lobby(object):
+    def __init__(self, seed=None, house=False, time_limit=None):
+        self.rng = random.Random(seed)
+        self.house = house
+        self.time_limit = time_limit
+        self.rooms = {}
+        self.lock = threading.Lock()
+
+    def create(self, session, mode, metadata):
+        room = Room(str(uuid.uuid4()), mode, metadata, self.rng.getrandbits(32), self.time_limit)
+        with self.lock:
+            self.rooms[room.id] = room
+        room.join(session)
+        if self.house:
+            room.join(HOUSE)
+        log.info('game_created', game=room.id, mode=mode, house=self.house)
+        return room
+
+    def get(self, id):
+        with self.lock:
+            return self.rooms.get(id)
+
+    def list(self, status=None, mode=None):
+        with self.lock:
+            rooms = list(self.rooms.values())
+        return [room for room in rooms if (status is None or room.status() == status) and (mode is None or room.mode == mode)]
+
+    def leave(self, room, session):
+        room.leave(room.seat(session))
+        with room.condition:
+            if session in room.sessions:
+                room.sessions[room.sessions.index(session)] = None
+            done = all(s in (None, HOUSE) for s in room.sessions)
+        if done:
+            with self.lock:
+                self.rooms.pop(room.id, None)
+            log.info('game_closed', game=room.id, time=room.duel.time, reason=room.duel.reason)
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body leave in one segment, flushed after every request
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def session(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        if SESSION_COOKIE in cookie:
+            return cookie[SESSION_COOKIE].value, False
+        return uuid.uuid4().hex, True
+
+    def reply(self, payload, code=200):
+        body = payload if isinstance(payload, str) else json.dumps(payload, separators=(',', ':'))
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.new_session:
+            self.send_header('Set-Cookie', '{}={}; Path=/'.format(SESSION_COOKIE, self.session_id))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def route(self, method):
+        self.session_id, self.new_session = self.session()
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        parts = [part for part in url.path.split('/') if part]
+        lobby = self.server.lobby
+        try:
+            if parts == ['game', 'list'] and method == 'GET':
+                rooms = lobby.list(params.get('status'), params.get('mode'))
+                return self.reply({'games': [{'id': room.id, 'mode': room.mode, 'metadata': room.metadata, 'status': room.status()} for room in rooms]})
+            elif parts == ['game', 'create'] and method == 'POST':
+                payload = self.read_json()
+                room = lobby.create(self.session_id, payload.get('mode'), payload.get('metadata', {}))
+                return self.reply({'success': True, 'id': room.id})
+            elif parts == ['game', 'join'] and method == 'POST':
+                payload = self.read_json()
+                room = lobby.get(payload.get('id'))
+                if room is None:
+                    return self.reply({'success': False, 'reason': 'no such game'}, 404)
+                room.join(self.session_id)
+                log.info('game_joined', game=room.id)
+                return self.reply({'success': True, 'id': room.id})
+            elif len(parts) == 2 and parts[0] == 'play':
+                room = lobby.get(parts[1])
+                if room is None:
+                    return self.reply({'success': False, 'reason': 'no such game'}, 404)
+                player = room.seat(self.session_id)
+                if method == 'GET':
+                    return self.reply(room.poll(player, bool(params.get('poll'))))
+                elif method == 'POST':
+                    event = self.read_json()
+                    if player is None:
+                        return self.reply({'success': False, 'reason': 'not playing in this game'})
+                    if event.get('type') != 'addPuyos':
+                        return self.reply({'success': False, 'reason': 'unsupported event {}'.format(event.get('type'))})
+                    room.play(player, event.get('blocks'))
+                    return self.reply({'success': True})
+                elif method == 'DELETE':
+                    lobby.leave(room, self.session_id)
+                    return self.reply({'success': True})
+            self.reply({'success': False, 'reason': 'not found'}, 404)
+        except IllegalMove as e:
+            self.reply({'success': False, 'reason': str(e)})
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def do_DELETE(self):
+        self.route('DELETE')
+
+    def log_message(self, format, *args):
+        log.debug('request', line=format % args)
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, lobby):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.lobby = lobby
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the panel-league server to load test the bridge against')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--house', action='store_true', help='Fill the second seat of every new game with a built-in player that drops pairs at random legal positions')
+    parser.add_argument('--time-limit', type=float, help='Seconds each player has per turn, players that run out lose the game')
+    parser.add_argument('--seed', type=int, help='Seed for the deals')
+    parser.add_argument('--log-level', choices=sorted(bridgelog.LEVELS), default='info')
+
+    args = parser.parse_args()
+    bridgelog.configure(args.log_level)
+    server = Server((args.host, args.port), Lobby(args.seed, args.house, args.time_limit))
+    log.info('listening', host=args.host, port=server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,122 @@
+import json
+from array import array
+
+try:
+    import ujson as fast_json
+except ImportError:
+    fast_json = None
+
+OJAMA = -1
+DEFAULT_WIDTH = 6
+
+def loads(payload):
+    if fast_json is not None:
+        return fast_json.loads(payload)
+    return json.loads(payload)
+
+class ChildState(object):
+    __slots__ = ("player", "blocks", "score", "ojama", "deal_index", "move", "cleared", "ojama_dropped")
+
+    def __init__(self, player, blocks, score, ojama, deal_index, move=None, cleared=False, ojama_dropped=False):
+        self.player = player
+        self.blocks = blocks
+        self.score = score
+        self.ojama = ojama
+        self.deal_index = deal_index
+        self.move = move
+        self.cleared = cleared
+        self.ojama_dropped = ojama_dropped
+
+    @classmethod
+    def from_json(cls, child):
+        move = None
+        for event in child.get("events", ()):
+            if "blocks" in event:
+                move = event["blocks"]
+        # Only the flags the interpolator needs are kept from the effects
+        cleared = False
+        ojama_dropped = False
+        for effect in child.get("effects", ()):
+            if effect["type"] == "groupCleared":
+                cleared = True
+            elif effect["type"] == "puyoDropped" and effect.get("color") == OJAMA:
+                ojama_dropped = True
+        return cls(
+            child["player"],
+            array("b", child["blocks"]),
+            child.get("totalScore", 0),
+            child.get("incomingNuisance", 0),
+            child["dealIndex"],
+            move,
+            cleared,
+            ojama_dropped,
+        )
+
+class GameState(object):
+    __slots__ = (
+        "time", "player", "width", "num_deals", "can_play", "terminated", "result",
+        "deal_offset", "deals", "children", "time_limit",
+    )
+
+    def __init__(self, time, player, width, num_deals, can_play, terminated, result, deal_offset, deals, children, time_limit=None):
+        self.time = time
+        self.player = player
+        self.width = width
+        self.num_deals = num_deals
+        self.can_play = can_play
+        self.terminated = terminated
+        self.result = result
+        self.deal_offset = deal_offset
+        self.deals = deals
+        self.children = children
+        self.time_limit = time_limit
+
+    @property
+    def own(self):
+        return self.children[self.player]
+
+    @property
+    def opponent(self):
+        return self.children[1 - self.player]
+
+    def deal(self, index):
+        return self.deals[index - self.deal_offset]
+
+    def visible_deals(self, child):
+        start = child.deal_index - self.deal_offset
+        return self.deals[start:start + self.num_deals]
+
+    def key(self):
+        return (self.time, self.can_play, self.terminated)
+
+    @classmethod
+    def from_json(cls, state):
+        children = sorted((ChildState.from_json(child) for child in state.get("childStates", ())), key=lambda child: child.player)
+        num_deals = state.get("numDeals", 3)
+        # Only the deals that are still visible are kept so a long match does not grow the state
+        deal_offset = min(child.deal_index for child in children) if children else 0
+        deal_end = max(child.deal_index for child in children) + num_deals if children else 0
+        deals = tuple(tuple(deal) for deal in state.get("deals", ())[deal_offset:deal_end])
+        status = state.get("status", {})
+        return cls(
+            state.get("time", 0),
+            state.get("player", 0),
+            state.get("width", DEFAULT_WIDTH),
+            num_deals,
+            bool(state.get("canPlay")),
+            bool(status.get("terminated")),
+            status.get("result"),
+            deal_offset,
+            deals,
+            tuple(children),
+            state.get("timeLimit"),
+        )
+
+    @classmethod
+    def from_payload(cls, payload):
+        return cls.from_json(loads(payload))
+
+def as_view(state):
+    if isinstance(state, GameState):
+        return state
+    return GameState.from_json(state)
@@ -0,0 +1,111 @@
+import io
+import os
+import socket
+import struct
+import subprocess
+
+HEADER = struct.Struct("I")
+BUFFER_SIZE = 4096
+
+class Transport(object):
+    def __init__(self):
+        self.message = bytearray()
+        self.buffer = bytearray(BUFFER_SIZE)
+
+    def send(self, payload):
+        # Python 2 has no writev so header and payload are joined in a reused buffer and written at once
+        message = self.message
+        del message[:]
+        message += HEADER.pack(len(payload))
+        message += payload
+        self.write(message)
+
+    def read_exactly(self, size):
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+        view = memoryview(self.buffer)
+        received = 0
+        while received < size:
+            count = self.read_into(view[received:size])
+            if not count:
+                raise EOFError("Bot closed its output after {} of {} bytes".format(received, size))
+            received += count
+        return view[:size]
+
+    def read_message(self):
+        self.read_exactly(HEADER.size)
+        size = HEADER.unpack_from(self.buffer)[0]
+        return self.read_exactly(size).tobytes()
+
+class PipeTransport(Transport):
+    def __init__(self, executable):
+        super(PipeTransport, self).__init__()
+        self.process = subprocess.Popen([executable], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.input = self.process.stdin.fileno()
+        self.output = io.FileIO(self.process.stdout.fileno(), "r", closefd=False)
+
+    def write(self, data):
+        view = memoryview(data)
+        try:
+            while view:
+                view = view[os.write(self.input, view):]
+        except OSError as e:
+            # A dead bot fails like a closed pipe file did before, as an IOError
+            raise IOError(e.errno, e.strerror)
+
+    def read_into(self, view):
+        return self.output.readinto(view)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+        self.process.wait()
+
+class SocketTransport(Transport):
+    def __init__(self, sock):
+        super(SocketTransport, self).__init__()
+        self.socket = sock
+        self.closed = False
+
+    def write(self, data):
+        self.socket.sendall(data)
+
+    def read_into(self, view):
+        return self.socket.recv_into(view, len(view))
+
+    def alive(self):
+        return not self.closed
+
+    def close(self):
+        self.closed = True
+        try:
+            # Wakes up the reader blocked in recv_into
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.socket.close()
+
+def parse_address(endpoint):
+    kind, _, address = endpoint.partition(":")
+    if kind == "unix":
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+def is_endpoint(command):
+    return command.startswith("unix:") or command.startswith("tcp:")
+
+def open_transport(command):
+    if not is_endpoint(command):
+        return PipeTransport(command)
+    family, address = parse_address(command)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.connect(address)
+    return SocketTransport(sock)